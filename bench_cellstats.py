@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+#
+# Benchmark each cellstats engine & scan mode on synthetic gate-level netlists (JSON report)
+
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cellstats
+
+# How each mode scans a netlist (see _run_case())
+_MODES = ('mmap', 'split', 'stream', 'hierarchy')
+# Cells generated per write (bounds the generator's memory at any netlist size)
+_CELLS_PER_BLOCK = 10000
+# Instances of the module one level down, in each module of a hierarchy
+_FANOUT = 2
+
+
+def _cell_line(rnd, cell, index):
+    if rnd.random() < 0.02:
+        return b'  (* keep *)\n  %s _%d_ (.A(net%d), .Y(_%d_));\n' % (cell, index, index, index + 1)
+    return (b'  %s _%d_ (\n    .A(_%d_),\n    .B(net%d),\n    .Y(_%d_)\n  );\n'
+            % (cell, index, index - 1, rnd.randrange(1 << 20), index + 1))
+
+
+def _write_module(file, rnd, name, size, filler_ratio, child=None):
+    '''Write a module of about size bytes (instantiating child _FANOUT times) & return its number of cells'''
+
+    fillers = cellstats._CELL_NAMES[:cellstats._FILLER_CELL_COUNT]
+    regulars = cellstats._CELL_NAMES[cellstats._FILLER_CELL_COUNT:]
+    file.write(b'module %s (a, y);\n  input a;\n  output y;\n  wire _0_;\n' % name.encode())
+    written = cells = 0
+    if child is not None:
+        for index in range(_FANOUT):
+            file.write(b'  %s u%d (.a(a), .y(y));\n' % (child.encode(), index))
+
+    while written < size:
+        lines = []
+        for _ in range(_CELLS_PER_BLOCK):
+            cells += 1
+            if rnd.random() < filler_ratio:
+                line = b'  %s FILLER_%d ();\n' % (rnd.choice(fillers), cells)
+            else:
+                line = _cell_line(rnd, rnd.choice(regulars), cells)
+            if cells % 64 == 0:
+                line += b'  // row %d\n' % (cells // 64)
+            lines.append(line)
+            written += len(line)
+            if written >= size:
+                break
+        file.write(b''.join(lines))
+    file.write(b'endmodule\n')
+    return cells
+
+
+def generate_netlist(filename, size, filler_ratio=0.1, depth=0, seed=0):
+    '''Write a synthetic netlist of about size bytes & return its description (with the expected cell counts)
+
+    With depth, the netlist is a chain of depth + 1 modules sharing the bytes, each one instantiating the one
+    below it _FANOUT times (so the hierarchical total counts the lower modules once per instance)
+    '''
+
+    rnd = random.Random(seed)
+    flat_cells = design_cells = 0
+    with open(filename, 'wb') as file:
+        child = None
+        for level in range(depth + 1):
+            name = 'top' if level == depth else f'level_{level}'
+            cells = _write_module(file, rnd, name, size // (depth + 1), filler_ratio, child)
+            flat_cells += cells
+            design_cells = cells + _FANOUT * design_cells
+            child = name
+    return {
+        'filename': filename,
+        'bytes': os.path.getsize(filename),
+        'filler_ratio': filler_ratio,
+        'depth': depth,
+        'seed': seed,
+        'cells': flat_cells,
+        'design_cells': design_cells,
+    }
+
+
+def _run_case(case):
+    '''Scan one netlist in this (fresh) process & measure it'''
+
+    filename = case['filename']
+    engine = case['engine']
+    start = time.perf_counter()
+    if case['mode'] == 'split':
+        statistics = cellstats.get_sky130_cell_statistics_from_file(filename, jobs=case['jobs'], engine=engine)
+    elif case['mode'] == 'stream':
+        # stdin is the netlist (always read in chunks instead of mapped)
+        statistics = next(cellstats.get_sky130_cell_statistics_from_files(['-'], jobs=1, engine=engine))
+    else:
+        statistics = next(cellstats.get_sky130_cell_statistics_from_files(
+            [filename], jobs=1, hierarchy=case['mode'] == 'hierarchy', engine=engine
+        ))
+    wall = time.perf_counter() - start
+
+    own, workers = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        'wall_s': wall,
+        'cpu_s': own.ru_utime + own.ru_stime + workers.ru_utime + workers.ru_stime,
+        # ru_maxrss is in KiB on Linux (& bytes on macOS)
+        'peak_rss_mb': max(own.ru_maxrss, workers.ru_maxrss) / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'cells': statistics['cells_with_filler'],
+    }
+
+
+def run_case(netlist, engine, mode, jobs):
+    '''Measure one engine & mode on a netlist in a fresh process (so peak RSS is its own)'''
+
+    case = {'filename': netlist['filename'], 'engine': engine, 'mode': mode, 'jobs': jobs}
+    with open(netlist['filename'], 'rb') as stdin:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--case', json.dumps(case)],
+            stdin=stdin, stdout=subprocess.PIPE, check=True,
+        ).stdout
+
+    result = {**case, **json.loads(output)}
+    result['bytes'] = netlist['bytes']
+    result['mb_per_s'] = netlist['bytes'] / 1e6 / result['wall_s']
+    result['cells_per_s'] = result['cells'] / result['wall_s']
+    result['expected_cells'] = netlist['design_cells' if mode == 'hierarchy' else 'cells']
+    result['exact'] = result['cells'] == result['expected_cells']
+    return result
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark cellstats engines & scan modes (JSON report)')
+    parser.add_argument('--sizes', default='1M,16M,128M',
+                        help='Comma-separated netlist sizes, up to "10G" (default: %(default)s)')
+    parser.add_argument('--filler-ratio', type=float, default=0.1, help='Share of filler cells (default: 0.1)')
+    parser.add_argument('--depth', type=int, default=0,
+                        help=f'Levels of modules below the top one (each instantiated {_FANOUT} times, default: 0)')
+    parser.add_argument('--engines', default=','.join(cellstats._ENGINES),
+                        help='Comma-separated engines (default: %(default)s)')
+    parser.add_argument('--modes', default=','.join(_MODES), help='Comma-separated scan modes (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Workers for the "split" mode (default: all cores)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case (the fastest is reported, default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the netlist generator (default: 0)')
+    parser.add_argument('--workdir', help='Keep generated netlists here, reusing them across runs '
+                                          '(default: a temporary directory)')
+    parser.add_argument('-o', '--output', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        json.dump(_run_case(json.loads(args.case)), sys.stdout)
+        return
+
+    modes = args.modes.split(',')
+    engines = args.engines.split(',')
+    for name, values, known in (('mode', modes, _MODES), ('engine', engines, cellstats._ENGINES)):
+        for value in values:
+            if value not in known:
+                parser.error(f'Unknown {name} {value!r} (expected one of: {", ".join(known)})')
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        workdir = args.workdir or temporary_directory
+        os.makedirs(workdir, exist_ok=True)
+        report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'netlists': [],
+            'results': [],
+        }
+        for size in map(cellstats._parse_size, args.sizes.split(',')):
+            filename = os.path.join(workdir, f'netlist-{size}-{args.filler_ratio}-{args.depth}-{args.seed}.v')
+            description_filename = f'{filename}.json'
+            if os.path.exists(description_filename):
+                with open(description_filename) as file:
+                    netlist = json.load(file)
+            else:
+                print(f'Generating {filename}', file=sys.stderr)
+                netlist = generate_netlist(filename, size, args.filler_ratio, args.depth, args.seed)
+                with open(description_filename, 'w') as file:
+                    json.dump(netlist, file)
+            report['netlists'].append(netlist)
+
+            for engine in engines:
+                for mode in modes:
+                    runs = [run_case(netlist, engine, mode, args.jobs) for _ in range(args.repeat)]
+                    result = min(runs, key=lambda run: run['wall_s'])
+                    report['results'].append(result)
+                    print(f'{os.path.basename(filename)} {engine} {mode}: {result["mb_per_s"]:.1f} MB/s, '
+                          f'{result["peak_rss_mb"]:.1f} MB peak RSS', file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
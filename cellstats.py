@@ -3,8 +3,29 @@
 # Mapping of sky130 hd cells to number of sites and number of transistors
 # (each site has a width of 460 nm and a height of 2720 nm)
 
+import glob
+import hashlib
+import json
 import mmap
+import os
 import re
+import socket
+import stat
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import Counter, deque
+from itertools import chain, filterfalse, repeat
+from operator import add, itemgetter, methodcaller, mul
+
+try:
+    import resource
+except ImportError:
+    resource = None
+# Decompressors, the worker pools, the result cache, the service, & matrix archives are imported where they are
+# used (so that short runs, like a client of the service, do not pay for them)
 
 # Cells stored as "bytes" objects to speed up RegEx search
 # (mmap'd files also prefer raw "bytes" comparisons)
@@ -456,53 +477,2793 @@ _REGULAR_CELLS = {
 }
 
 
-def get_sky130_cell_statistics_from_file(filename, verbose=False):
-    '''Count Skywater 130nm cells, sites, & transistors in file (with fillers seperately)'''
+# Cell IDs index the arrays below (fillers come first, so regular cells are IDs _FILLER_CELL_COUNT and up)
+_CELL_NAMES = [*_FILLER_CELLS, *_REGULAR_CELLS]
+_CELL_IDS = {cell: cell_id for cell_id, cell in enumerate(_CELL_NAMES)}
+_CELL_SITES = array('q', (sites for sites, _ in (*_FILLER_CELLS.values(), *_REGULAR_CELLS.values())))
+_CELL_TRANSISTORS = array('q', (transistors for _, transistors in (*_FILLER_CELLS.values(), *_REGULAR_CELLS.values())))
+_FILLER_CELL_COUNT = len(_FILLER_CELLS)
+# Area of a site in µm² (the 460 nm x 2720 nm unit site of sky130_fd_sc_hd, see the top of this file)
+_SITE_AREA_UM2 = 0.46 * 2.72
+# Area of each cell in µm² (the cells above fill whole sites, while loaded libraries give each cell's LEF size)
+_CELL_AREAS = array('d', (sites * _SITE_AREA_UM2 for sites in _CELL_SITES))
+
+# Cell names never contain a non-word byte, so regex scans of ranges split there are independent
+_SPLIT_PATTERN = re.compile(rb'\W')
+_WORD_BYTES = b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz'
+_MIN_SPLIT_SIZE = 1024 * 1024
+# Bytes matched per findall() call (bounds memory no matter how large the file is)
+_SCAN_WINDOW = 16 * 1024 * 1024
+
+# Single-pass lexer: comments, attributes, strings, & escaped identifiers are matched (& skipped) whole,
+# so only cell names in instantiation position ("sky130_... [#(...)] name (") are captured (minus "sky130_")
+# Every alternative starts with a literal, which lets the regex engine skip ahead to the next candidate
+_SKIPPED_CONSTRUCTS = rb'''
+      /(?:/[^\n]*|\*.*?(?:\*/|\Z))
+    | \(\*(?!\)).*?(?:\*\)|\Z)
+    | "(?:[^"\\\n]|\\.)*"?
+    | \\\S+
+'''
+_STRUCTURAL_PATTERN = re.compile(rb'''
+      sky130_(?<![\w$]sky130_)(\w+)(?=\s*\#|\s+[A-Za-z_\\])
+    | ''' + _SKIPPED_CONSTRUCTS, re.DOTALL | re.VERBOSE)
+# The same, for text without any of the constructs skipped above
+_INSTANTIATION_PATTERN = re.compile(rb'sky130_(?<![\w$]sky130_)(\w+)(?=\s*#|\s+[A-Za-z_\\])')
+_SKIPPED_MARKERS = (b'/', b'(*', b'"', b'\\')
+# Skipped constructs that can span lines (opener & closer)
+_MULTILINE_MARKERS = ((b'/*', b'*/'), (b'(*', b'*)'))
+# Statements end with ";" (a structural scan started on the next line is in sync unless a comment spans it)
+_STATEMENT_END_PATTERN = re.compile(rb';[ \t]*\r?\n')
+_FIRST_GROUP = methodcaller('group', 1)
+
+
+def _new_cell_counts():
+    # One count per cell ID, then one for unknown cells (_unknown_cell_id())
+    return array('q', bytes(_CELL_SITES.itemsize * (len(_CELL_NAMES) + 1)))
+
+
+def _unknown_cell_id():
+    return len(_CELL_NAMES)
+
+
+def _add_cell_counts(counts, other_counts):
+    return array('q', map(add, counts, other_counts))
+
+
+def _dot(counts, values):
+    return sum(map(mul, counts, values))
+
+
+def _cell_counts_from_histogram(histogram):
+    # Hash each distinct cell once (cells missing from the tables, or counted as None by an engine, are unknown)
+    counts = _new_cell_counts()
+    unknown_cell_id = _unknown_cell_id()
+    for cell, count in histogram.items():
+        counts[_CELL_IDS.get(cell, unknown_cell_id)] += count
+    return counts
+
+
+def _count_lines(buffer, start, end):
+    '''Number of newlines in buffer[start:end] (mmap objects have no count(), so copy those a window at a time)'''
+
+    if isinstance(buffer, bytes):
+        return buffer.count(b'\n', start, end)
+    return sum(
+        buffer[window_start:min(window_start + _SCAN_WINDOW, end)].count(b'\n')
+        for window_start in range(start, end, _SCAN_WINDOW)
+    )
+
+
+class CellTracer:
+    '''Buffered trace of each cell matched, written to a text file
+
+    Formats: "jsonl" & "csv" records (file, byte offset, line, cell, filler flag, sites, transistors), or the
+    "verbose" lines of -v; sample keeps every sample-th match, & aggregate writes one record per cell type &
+    file instead (count, sites, transistors, & the offset & line of its first match)
+    '''
+
+    def __init__(self, file, format='jsonl', sample=1, aggregate=False):
+        if format not in ('jsonl', 'csv', 'verbose'):
+            raise ValueError(f'Unknown trace format {format!r} (expected jsonl, csv, or verbose)')
+        if format == 'verbose' and aggregate:
+            raise ValueError('The verbose trace format lists every match (it cannot aggregate)')
+        self.file = file
+        self.format = format
+        self.sample = max(sample, 1)
+        self.aggregate = aggregate
+        self._header = format == 'csv'
+        self._suffixes = {}
+
+    def begin(self, filename):
+        '''Start tracing the matches of file (at byte offset 0, line 1)'''
+
+        if self._header:
+            self.file.write('file,cell,filler,count,sites,transistors,first_offset,first_line\n' if self.aggregate
+                            else 'file,offset,line,cell,filler,sites,transistors\n')
+            self._header = False
+        if self.format == 'jsonl':
+            self._prefix = f'{{"file": {json.dumps(filename)}, '
+        elif self.format == 'csv' and any(character in filename for character in ',"\r\n'):
+            self._prefix = '"' + filename.replace('"', '""') + '",'
+        else:
+            self._prefix = f'{filename},' if self.format == 'csv' else f'{filename}:  '
+        self._base, self._position, self._line, self._next, self._seen = 0, 0, 1, 0, 0
+        self._cells = {}  # Cell => [count, first offset, first line] (aggregating)
+
+    def cells(self, buffer, matches):
+        '''Trace matches ((position in buffer, cell) pairs, in order), skipping positions traced already'''
+
+        if not matches:
+            return
+        # Lines are counted in a copy of the traced bytes (mmap objects have no count())
+        text, text_start = buffer, 0
+        if self.format != 'verbose' and not isinstance(buffer, bytes):
+            text, text_start = buffer[self._position:matches[-1][0]], self._position
+
+        records = []
+        suffixes = self._suffixes
+        prefix, base, line, last = self._prefix, self._base, self._line, self._position
+        following, seen = self._next, self._seen
+        for position, cell in matches:
+            if position < following:
+                continue  # Rescanned (like a chunk held back until a comment across it ends)
+            following = position + 1
+            seen += 1
+            if seen % self.sample:
+                continue
+
+            suffix = suffixes.get(cell) or self._suffix(cell)
+            if self.format == 'verbose':
+                records.append(f'{prefix}{cell}  => {suffix}')
+                continue
+            line += text.count(b'\n', last - text_start, position - text_start)
+            last = position
+            if self.aggregate:
+                entry = self._cells.get(cell)
+                if entry is None:
+                    self._cells[cell] = [1, base + position, line]
+                else:
+                    entry[0] += 1
+            elif self.format == 'jsonl':
+                records.append(f'{prefix}"offset": {base + position}, "line": {line}, {suffix}')
+            else:
+                records.append(f'{prefix}{base + position},{line},{suffix}')
+
+        self._line, self._position, self._next, self._seen = line, last, following, seen
+        if records:
+            self.file.write(''.join(records))
+
+    def advance(self, buffer, consumed):
+        '''Move on to a buffer that continues this one from consumed bytes into it'''
+
+        if self.format != 'verbose':
+            self._line += _count_lines(buffer, self._position, consumed)
+        self._base += consumed
+        self._position = 0
+        self._next = max(self._next - consumed, 0)
+
+    def end(self):
+        '''Finish the file (writing its aggregate records)'''
+
+        for cell, (count, offset, line) in self._cells.items():
+            cell_id = _CELL_IDS.get(cell)
+            filler, sites, transistors = None, None, None
+            if cell_id is not None:
+                filler = cell_id < _FILLER_CELL_COUNT
+                sites, transistors = count * _CELL_SITES[cell_id], count * _CELL_TRANSISTORS[cell_id]
+            if self.format == 'jsonl':
+                self.file.write(
+                    f'{self._prefix}"cell": "{cell.decode()}", "filler": {json.dumps(filler)}, "count": {count}, '
+                    f'"sites": {json.dumps(sites)}, "transistors": {json.dumps(transistors)}, '
+                    f'"first_offset": {offset}, "first_line": {line}}}\n'
+                )
+            else:
+                filler, sites, transistors = ('' if value is None else int(value)
+                                              for value in (filler, sites, transistors))
+                self.file.write(
+                    f'{self._prefix}{cell.decode()},{filler},{count},{sites},{transistors},{offset},{line}\n'
+                )
+        self._cells = {}
+        self.file.flush()
+
+    def _suffix(self, cell):
+        # Everything after the offset & line is the same for each match of a cell (so format it once)
+        suffix = self._suffixes.get(cell)
+        if suffix is not None:
+            return suffix
+
+        cell_id = _CELL_IDS.get(cell)
+        filler, sites, transistors = None, None, None
+        if cell_id is not None:
+            filler, sites, transistors = cell_id < _FILLER_CELL_COUNT, _CELL_SITES[cell_id], _CELL_TRANSISTORS[cell_id]
+        if self.format == 'verbose' and cell_id is None:
+            suffix = '(Unknown)\n'
+        elif self.format == 'verbose':
+            suffix = f'({"Filler" if filler else "Regular"}, {sites}, {transistors})\n'
+        elif self.format == 'jsonl':
+            suffix = (f'"cell": "{cell.decode()}", "filler": {json.dumps(filler)}, "sites": {json.dumps(sites)}, '
+                      f'"transistors": {json.dumps(transistors)}}}\n')
+        else:
+            suffix = f'{cell.decode()},' + ','.join(
+                '' if value is None else str(int(value)) for value in (filler, sites, transistors)
+            ) + '\n'
+        self._suffixes[cell] = suffix
+        return suffix
+
+
+class _RegexEngine:
+    '''Count every "sky130_..." token as a cell (fastest, but comments, attributes, & net names count too)'''
+
+    def count(self, buffer, start, end, tracer=None):
+        '''Histogram of the cells in buffer[start:end] & the position a scan of the following bytes resumes at'''
+
+        histogram = Counter()
+        while start < end:
+            window_end = end
+            if end - start > _SCAN_WINDOW:
+                boundary = _SPLIT_PATTERN.search(buffer, start + _SCAN_WINDOW, end)
+                if boundary is not None:
+                    window_end = boundary.start()
+
+            if tracer:
+                matches = [
+                    (match.start(), match.group()) for match in _CELL_PATTERN.finditer(buffer, start, window_end)
+                ]
+                histogram.update(cell for _, cell in matches)
+                tracer.cells(buffer, matches)
+            else:
+                histogram.update(_CELL_PATTERN.findall(buffer, start, window_end))
+            start = window_end
+        return histogram, end
+
+    def next_boundary(self, buffer, offset):
+        '''First position at or after offset that a separate scan can start from (None if there is none)'''
+
+        boundary = _SPLIT_PATTERN.search(buffer, offset)
+        return None if boundary is None else boundary.start()
+
+    def last_boundary(self, data):
+        '''Last position in data that a separate scan can start from (0 if there is none)'''
+
+        return len(data.rstrip(_WORD_BYTES))
+
+    def open_construct(self, data):
+        '''Nothing is skipped, so no construct is left open at the end of data (see _StructuralEngine)'''
+
+        return len(data), None, None
+
+
+class _StructuralEngine:
+    '''Count only cell names in instantiation position (skipping comments, attributes, strings, & net names)'''
+
+    def count(self, buffer, start, end, tracer=None):
+        '''Histogram of the cells in buffer[start:end] & the position a scan of the following bytes resumes at'''
+
+        if tracer:
+            histogram, resume = self._count_exactly(buffer, start, end, tracer)
+            return self._cell_histogram(histogram), resume
+
+        histogram = Counter()
+        resume = end
+        while start < end:
+            window_end = end
+            if end - start > _SCAN_WINDOW:
+                boundary = _STATEMENT_END_PATTERN.search(buffer, start + _SCAN_WINDOW, end)
+                if boundary is not None:
+                    window_end = boundary.end()
+
+            if not self._ends_cleanly(buffer, start, window_end):
+                window_histogram, window_resume = self._count_exactly(buffer, start, window_end)
+                histogram.update(window_histogram)
+                resume = max(resume, window_resume)
+                start = max(window_end, window_resume)
+                continue
+
+            # Nothing spans the end of the window, so findall() scans it exactly (& fastest)
+            self._count_between_skipped(buffer, start, window_end, histogram)
+            start = window_end
+        return self._cell_histogram(histogram), resume
+
+    def _count_between_skipped(self, buffer, start, end, histogram):
+        '''Count the cells in buffer[start:end] (which nothing spans the end of) into histogram, with the plain
+        _INSTANTIATION_PATTERN between the skipped constructs (only those are matched with _STRUCTURAL_PATTERN)
+        '''
+
+        next_markers = {marker: buffer.find(marker, start, end) for marker in _SKIPPED_MARKERS}
+        position = start
+        while position < end:
+            for marker, found in next_markers.items():
+                if 0 <= found < position:
+                    next_markers[marker] = buffer.find(marker, position, end)
+            marker_position = min((found for found in next_markers.values() if found >= 0), default=end)
+            # No cell name can span a marker, but its lookahead may need the first byte ("\" of a name after it)
+            histogram.update(_INSTANTIATION_PATTERN.findall(buffer, position, min(marker_position + 1, end)))
+            if marker_position == end:
+                break
+            skipped = _STRUCTURAL_PATTERN.match(buffer, marker_position, end)
+            position = marker_position + 1 if skipped is None else skipped.end()
+
+    def _ends_cleanly(self, buffer, start, end):
+        '''Whether a scan of buffer[start:end] cannot run into (or depend on) the bytes after end'''
+
+        if end >= len(buffer):
+            return True
+        statement_end = buffer.rfind(b';', max(start, end - 256), end)
+        boundary = _STATEMENT_END_PATTERN.match(buffer, statement_end) if statement_end >= 0 else None
+        if boundary is None or boundary.end() != end:
+            return False
+
+        # A block comment or attribute still open at its last opener would continue past end
+        for opener, closer in _MULTILINE_MARKERS:
+            position = buffer.rfind(opener, start, end + 1)
+            if position >= 0 and buffer.find(closer, position + len(opener), end) < 0:
+                return False
+        return True
+
+    def _count_exactly(self, buffer, start, end, tracer=None):
+        '''Histogram of the matches in buffer[start:end] (no matter what follows end) & where the last one ends'''
 
-    global _CELL_PATTERN, _FILLER_CELLS, _REGULAR_CELLS
-    file_statistics = {
-        'filename': filename,
-        'cells': 0,
-        'sites': 0,
-        'transistors': 0,
-        'cells_with_filler': 0,
-        'sites_with_filler': 0,
-        'transistors_with_filler': 0,
+        histogram = Counter()
+        resume = end
+        if tracer:
+            matches = [(match.start(), match.group(1)) for match in _STRUCTURAL_PATTERN.finditer(buffer, start, end)]
+            if end < len(buffer):
+                # The last match may have been cut short at end (& later ones missed), so redo them in full
+                tail = matches.pop()[0] if matches else start
+                for match in _STRUCTURAL_PATTERN.finditer(buffer, tail):
+                    if match.start() >= end:
+                        break
+                    matches.append((match.start(), match.group(1)))
+                    resume = max(resume, match.end())
+            histogram.update(cell for _, cell in matches)
+            tracer.cells(buffer, [(position, b'sky130_' + cell) for position, cell in matches if cell is not None])
+            return histogram, resume
+
+        # Count at C speed (remembering only the last match, to patch up the end of the range below)
+        last_match = deque(maxlen=1)
+        matches = filterfalse(last_match.append, _STRUCTURAL_PATTERN.finditer(buffer, start, end))
+        histogram.update(map(_FIRST_GROUP, matches))
+
+        if end < len(buffer):
+            # The last match may have been cut short at end (& later ones missed), so redo them in full
+            tail = start
+            if last_match:
+                tail = last_match[0].start()
+                histogram[last_match[0].group(1)] -= 1
+            for match in _STRUCTURAL_PATTERN.finditer(buffer, tail):
+                if match.start() >= end:
+                    break
+                histogram[match.group(1)] += 1
+                resume = max(resume, match.end())
+        return histogram, resume
+
+    def _cell_histogram(self, histogram):
+        # Skipped constructs match without a cell name (b'' from findall(), None from finditer())
+        return Counter({b'sky130_' + cell: count for cell, count in histogram.items() if cell and count})
+
+    def next_boundary(self, buffer, offset):
+        '''First position at or after offset that a separate scan can start from (None if there is none)'''
+
+        boundary = _STATEMENT_END_PATTERN.search(buffer, offset)
+        return None if boundary is None else boundary.end()
+
+    def last_boundary(self, data):
+        '''Last position in data that a separate scan can start from (0 if there is none)'''
+
+        position = len(data)
+        while (position := data.rfind(b';', 0, position)) >= 0:
+            boundary = _STATEMENT_END_PATTERN.match(data, position)
+            if boundary is not None:
+                return boundary.end()
+        return 0
+
+    def open_construct(self, data):
+        '''Start of the skipped construct that a scan of data runs to the end of (len(data) if none does), then
+        (for a block comment or attribute, which only its closer can end) where its body starts & that closer
+        (else None, None)
+        '''
+
+        last_match = deque(_STRUCTURAL_PATTERN.finditer(data), maxlen=1)
+        if not last_match or last_match[0].end() < len(data):
+            return len(data), None, None
+        start = last_match[0].start()
+        for opener, closer in _MULTILINE_MARKERS:
+            if data.startswith(opener, start):
+                return start, start + len(opener), closer
+        return start, None, None
+
+
+class _VocabularyEngine(_RegexEngine):
+    '''Count every "sky130_..." token, matching known cells against the cell vocabulary (unknown ones separately)'''
+
+    def __init__(self):
+        self._names = None
+        self._pattern = None
+
+    def count(self, buffer, start, end, tracer=None):
+        '''Histogram of the cells in buffer[start:end] (unknown cells under None) & where a following scan resumes'''
+
+        pattern = self._vocabulary_pattern()
+        histogram = Counter()
+        while start < end:
+            window_end = end
+            if end - start > _SCAN_WINDOW:
+                boundary = _SPLIT_PATTERN.search(buffer, start + _SCAN_WINDOW, end)
+                if boundary is not None:
+                    window_end = boundary.start()
+
+            if tracer:
+                matches = []
+                for match in pattern.finditer(buffer, start, window_end):
+                    histogram[match.group(1)] += 1
+                    matches.append((match.start(), match.group()))
+                tracer.cells(buffer, matches)
+            else:
+                histogram.update(pattern.findall(buffer, start, window_end))
+            start = window_end
+
+        # Known cells match without their "sky130_" prefix, unknown ones without the group (b'' or None)
+        cells = Counter({None: histogram.pop(b'', 0) + histogram.pop(None, 0)})
+        cells.update({b'sky130_' + cell: count for cell, count in histogram.items()})
+        return +cells, end
+
+    def _vocabulary_pattern(self):
+        # Rebuilt only when other cell tables come into use
+        if self._names is not _CELL_NAMES:
+            self._names = _CELL_NAMES
+            # Atomic, as the trie already prefers the longest name (a shorter one can't end the token either)
+            self._pattern = re.compile(
+                rb'sky130_(?:((?>' + _trie_pattern(cell.removeprefix(b'sky130_') for cell in _CELL_NAMES) + rb'))(?!\w)'
+                rb'|\w+)'
+            )
+        return self._pattern
+
+
+def _trie_pattern(words):
+    '''Regex matching exactly these words, factored into a trie (so each byte is compared once)'''
+
+    trie = {}
+    for word in words:
+        node = trie
+        for byte in word:
+            node = node.setdefault(byte, {})
+        node[None] = None
+
+    def branch(node):
+        alternatives = []
+        for byte, child in node.items():
+            if byte is None:
+                continue
+            prefix = bytes([byte])
+            while len(child) == 1 and None not in child:
+                (byte, child), = child.items()
+                prefix += bytes([byte])
+            alternatives.append(re.escape(prefix) + branch(child))
+        if not alternatives:
+            return b''
+        if len(alternatives) == 1 and None not in node:
+            return alternatives[0]
+        return b'(?:' + b'|'.join(alternatives) + b')' + (b'?' if None in node else b'')
+
+    return branch(trie)
+
+
+_ENGINES = {
+    'structural': _StructuralEngine(),
+    'regex': _RegexEngine(),
+    'vocabulary': _VocabularyEngine(),
+}
+
+
+def _count_cells(buffer, start, end, tracer=None, engine='structural'):
+    '''Count each cell type in buffer[start:end] (in one pass, tracing each match to the optional CellTracer)'''
+
+    histogram, _ = _ENGINES[engine].count(buffer, start, end, tracer)
+    return _cell_counts_from_histogram(histogram)
+
+
+class CellStatistics:
+    '''Cell, site, & transistor totals of a file (with & without fillers): the typed form of its statistics dict
+
+    Results add up with + (& sum()), into the totals of several files (keeping the filename only if they share it,
+    & adding up per_cell & modules if both have them); per_cell, modules ({module: (is_top, CellStatistics)}),
+    scan_stats, & error are None unless they were asked for
+    A file that failed with keep_going has its error & no totals, so adding it raises ValueError (filter out the
+    results with an error first)
+    '''
+
+    __slots__ = ('filename', 'cells', 'sites', 'transistors', 'cells_with_filler', 'sites_with_filler',
+                 'transistors_with_filler', 'unknown_cells', 'per_cell', 'modules', 'scan_stats', 'error')
+    # The totals (in the order of the statistics dict & of the CSV columns)
+    _fields = __slots__[:8]
+
+    def __init__(self, filename=None, cells=0, sites=0, transistors=0, cells_with_filler=0, sites_with_filler=0,
+                 transistors_with_filler=0, unknown_cells=0, per_cell=None, modules=None, scan_stats=None, error=None):
+        self.filename = filename
+        self.cells = cells
+        self.sites = sites
+        self.transistors = transistors
+        self.cells_with_filler = cells_with_filler
+        self.sites_with_filler = sites_with_filler
+        self.transistors_with_filler = transistors_with_filler
+        self.unknown_cells = unknown_cells
+        self.per_cell = per_cell
+        self.modules = modules
+        self.scan_stats = scan_stats
+        self.error = error
+
+    @classmethod
+    def from_counts(cls, filename, counts, per_cell=False, modules=None):
+        '''The statistics of cell counts (indexed by cell ID) & of each module's ({module: (is_top, counts)})'''
+
+        regular = slice(_FILLER_CELL_COUNT, _unknown_cell_id())
+        regular_counts = counts[regular]
+        return cls(
+            filename,
+            sum(regular_counts),
+            _dot(regular_counts, _CELL_SITES[regular]),
+            _dot(regular_counts, _CELL_TRANSISTORS[regular]),
+            sum(counts[:_unknown_cell_id()]),
+            _dot(counts, _CELL_SITES),
+            _dot(counts, _CELL_TRANSISTORS),
+            counts[_unknown_cell_id()],
+            _cell_histogram_from_counts(counts) if per_cell else None,
+            None if modules is None else {
+                module: (is_top, cls.from_counts(filename, module_counts, per_cell))
+                for module, (is_top, module_counts) in modules.items()
+            },
+        )
+
+    def __add__(self, other):
+        if not isinstance(other, CellStatistics):
+            return NotImplemented
+        for operand in (self, other):
+            if operand.error is not None:
+                raise ValueError(f'{operand.filename} failed ({operand.error}), so it has no totals to add')
+        per_cell = None
+        if self.per_cell is not None and other.per_cell is not None:
+            per_cell = dict(self.per_cell)
+            for cell, cell_statistics in other.per_cell.items():
+                per_cell[cell] = tuple(map(add, per_cell.get(cell, (0, 0, 0)), cell_statistics))
+        modules = None
+        if self.modules is not None and other.modules is not None:
+            # A module is top if it is top in either file
+            modules = dict(self.modules)
+            for module, (is_top, module_statistics) in other.modules.items():
+                if module in modules:
+                    modules[module] = (modules[module][0] or is_top, modules[module][1] + module_statistics)
+                else:
+                    modules[module] = (is_top, module_statistics)
+        return CellStatistics(
+            self.filename if self.filename == other.filename else None,
+            *(getattr(self, field) + getattr(other, field) for field in self._fields[1:]),
+            per_cell=per_cell,
+            modules=modules,
+        )
+
+    def __radd__(self, other):
+        # So sum() can start from 0
+        return self if other == 0 else NotImplemented
+
+    def __eq__(self, other):
+        if not isinstance(other, CellStatistics):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f'CellStatistics({", ".join(f"{field}={getattr(self, field)!r}" for field in self._fields)})'
+
+    def _asdict(self):
+        '''The statistics dict of get_sky130_cell_statistics_from_file() (with its optional keys if set)'''
+
+        if self.error is not None:
+            return {'filename': self.filename, 'error': self.error}
+        file_statistics = {field: getattr(self, field) for field in self._fields}
+        if self.per_cell is not None:
+            file_statistics['per_cell'] = self.per_cell
+        if self.modules is not None:
+            file_statistics['modules'] = {
+                module: {'filename': self.filename, 'module': module, 'top': is_top, **module_statistics._asdict()}
+                for module, (is_top, module_statistics) in self.modules.items()
+            }
+        if self.scan_stats is not None:
+            file_statistics['scan_stats'] = self.scan_stats
+        return file_statistics
+
+
+def _file_statistics_from_counts(filename, counts, per_cell=False, modules=None):
+    return CellStatistics.from_counts(filename, counts, per_cell, modules)._asdict()
+
+
+def _cell_histogram_from_counts(counts):
+    return {
+        _CELL_NAMES[cell_id].decode(): (count, count * _CELL_SITES[cell_id], count * _CELL_TRANSISTORS[cell_id])
+        for cell_id, count in enumerate(counts[:_unknown_cell_id()])
+        if count
     }
 
+
+def _count_cells_in_stream(stream, tracer=None, engine='structural'):
+    '''Count each cell type in a file-like object (read in bounded chunks)'''
+
+    counts = _new_cell_counts()
+    carry = b''
+    closer = None  # Of the block comment or attribute that carry is inside of
+    while chunk := stream.read(_SCAN_WINDOW):
+        data = carry + chunk
+        if closer is not None:
+            # Skip the rest of the comment or attribute (without rescanning it, however many chunks it spans)
+            closed = data.find(closer)
+            consumed = len(data) - len(closer) + 1 if closed < 0 else closed + len(closer)
+            if tracer:
+                tracer.advance(data, consumed)
+            data = data[consumed:]
+            if closed < 0:
+                carry = data  # In case the closer is split across chunks
+                continue
+            closer = None
+
+        # Hold back the end of the chunk (like a partial cell name) until the next chunk completes it
+        boundary = _ENGINES[engine].last_boundary(data)
+        histogram, resume = _ENGINES[engine].count(data, 0, boundary, tracer)
+        consumed = max(boundary, resume)
+        if resume >= len(data):
+            # Something (like a comment) may run past this chunk: the matches before it are complete, so hold
+            # back only the construct (or skip to its closer) until the rest of it is read
+            consumed, body_start, closer = _ENGINES[engine].open_construct(data)
+            if closer is not None:
+                consumed = body_start
+        counts = _add_cell_counts(counts, _cell_counts_from_histogram(histogram))
+        if tracer:
+            tracer.advance(data, consumed)
+        carry = data[consumed:]
+    if closer is not None:
+        return counts  # A comment or attribute left open runs to the end of the file
+    return _add_cell_counts(counts, _count_cells(carry, 0, len(carry), tracer, engine))
+
+
+def _open_decompressed(file):
+    '''Wrap file in a decompressor when it starts with gzip/xz/bz2/zstd magic (else return None)'''
+
+    magic = file.peek(6)[:6]
+    if magic.startswith(b'\x1f\x8b'):
+        import gzip
+        return gzip.GzipFile(fileobj=file)
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        import lzma
+        return lzma.LZMAFile(file)
+    if magic.startswith(b'BZh'):
+        import bz2
+        return bz2.BZ2File(file)
+    if magic.startswith(b'\x28\xb5\x2f\xfd'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ModuleNotFoundError('Reading zstd-compressed files requires the "zstandard" package') from None
+        return zstandard.ZstdDecompressor().stream_reader(file)
+    return None
+
+
+def _is_mappable(file):
+    '''Whether file is a non-empty, uncompressed regular file (the mmap fast path)'''
+
+    status = os.fstat(file.fileno())
+    return stat.S_ISREG(status.st_mode) and status.st_size > 0 and _open_decompressed(file) is None
+
+
+def _advise_sequential(file, start=0, end=None):
+    '''Tell the kernel that bytes [start, end) of a file (or mmap) will be read once, in order
+
+    (so it reads ahead aggressively & drops pages behind us, which keeps cold network filesystems streaming)
+    '''
+
+    if end is not None and end <= start:
+        return  # Nothing to read (like a range that the previous scan ran past)
+    try:
+        if isinstance(file, mmap.mmap):
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                # madvise() ranges must start on a page boundary
+                start -= start % mmap.PAGESIZE
+                file.madvise(mmap.MADV_SEQUENTIAL, start, (len(file) if end is None else end) - start)
+        elif hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(file.fileno(), start, 0 if end is None else end - start, os.POSIX_FADV_SEQUENTIAL)
+    except OSError:
+        pass  # Only a hint (pipes & some filesystems refuse it)
+
+
+def _count_cells_in_file(filename, start=0, end=None, tracer=None, engine='structural'):
+    '''Count each cell type in bytes [start, end) of file ("-" for stdin, compressed files are streamed)
+
+    Also returns the position a scan of the following bytes has to resume at (past end if a match crosses it)
+    '''
+
+    if filename == '-':
+        file = sys.stdin.buffer
+        return _count_cells_in_stream(_open_decompressed(file) or file, tracer, engine), None
+
     with open(filename, 'rb') as file:
+        if not _is_mappable(file):
+            _advise_sequential(file)
+            with _open_decompressed(file) or file as stream:
+                return _count_cells_in_stream(stream, tracer, engine), None
+
         # Reduce SLOW file I/O when scaning large files
         with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmfile:
+            end = len(mmfile) if end is None else end
+            _advise_sequential(mmfile, start, end)
+            histogram, resume = _ENGINES[engine].count(mmfile, start, end, tracer)
+            return _cell_counts_from_histogram(histogram), resume
+
+
+# Module boundaries & instantiations of the modules defined in a file
+# ("type [#(parameters)] name [[msb:lsb]] (ports) [, name [[msb:lsb]] (ports)]...;"), found from literal-led
+# candidates ("module" & the names of the modules) that are only kept outside of the constructs skipped by
+# _STRUCTURAL_PATTERN (see _outside_skipped())
+_MODULE_PATTERN = re.compile(rb'module\b')  # Also ends "endmodule" & "macromodule"
+_MODULE_NAME_PATTERN = re.compile(rb'\s+(\\\S+|[A-Za-z_][\w$]*)')
+_PARAMETERS_PATTERN = re.compile(rb'\s*\#\s*\(')
+_INSTANCE_NAME_PATTERN = re.compile(rb'\s*(?:\\\S+|[A-Za-z_][\w$]*)\s*(?:\[\s*(\d*)\s*(?::\s*(\d+)\s*)?\]\s*)?\(')
+_INSTANCE_SEPARATOR_PATTERN = re.compile(rb'\s*,')
+# Parentheses, except in the constructs skipped by _STRUCTURAL_PATTERN (like "\\escaped(name) ")
+_PARENTHESIS_PATTERN = re.compile(_SKIPPED_CONSTRUCTS + rb'| ([()])', re.DOTALL | re.VERBOSE)
+# Bytes that continue an identifier (so a module name right after one is only part of a longer name)
+_IDENTIFIER_BYTES = frozenset(_WORD_BYTES + b'$')
+_INSTANCE_PREFIX_BYTES = frozenset(_WORD_BYTES + b'$.\\')
+
+
+def _scale_cell_counts(counts, factor):
+    return array('q', (count * factor for count in counts))
+
+
+def _roll_up_modules(module_counts, module_instances):
+    '''Cell counts of one instance of each module, including its submodules (each module is summed once)'''
+
+    totals = {}
+    expanded = set()
+    for root in module_counts:
+        stack = [root]
+        while stack:
+            module = stack[-1]
+            if module in totals:
+                stack.pop()
+                continue
+
+            children = [child for child in module_instances[module] if child not in totals]
+            if children:
+                if module in expanded:
+                    raise ValueError(f'Module {module} instantiates itself (through {", ".join(children)})')
+                expanded.add(module)
+                stack.extend(children)
+                continue
+
+            counts = module_counts[module]
+            for child, instances in module_instances[module].items():
+                counts = _add_cell_counts(counts, _scale_cell_counts(totals[child], instances))
+            totals[module] = counts
+            stack.pop()
+    return totals
+
+
+def _outside_skipped(matches, buffer, start, end):
+    '''The matches (from buffer[start:end], in order) that start outside of the constructs skipped by
+    _STRUCTURAL_PATTERN, which are found from their markers (like _StructuralEngine._count_between_skipped() does)
+    '''
+
+    next_markers = {marker: buffer.find(marker, start, end) for marker in _SKIPPED_MARKERS}
+    position = start  # Outside of any skipped construct
+    for match in matches:
+        candidate = match.start()
+        while position < candidate:
+            for marker, found in next_markers.items():
+                if 0 <= found < position:
+                    next_markers[marker] = buffer.find(marker, position, end)
+            marker_position = min((found for found in next_markers.values() if found >= 0), default=end)
+            if marker_position >= candidate:
+                break
+            skipped = _STRUCTURAL_PATTERN.match(buffer, marker_position, end)
+            position = marker_position + 1 if skipped is None else skipped.end()
+        if position <= candidate:
+            yield match
+
+
+def _skip_parentheses(buffer, position, end):
+    '''Position right after the parenthesis that closes the one at position (None if none does before end)'''
+
+    depth = 0
+    for match in _PARENTHESIS_PATTERN.finditer(buffer, position, end):
+        parenthesis = match.group(1)
+        if parenthesis == b'(':
+            depth += 1
+        elif parenthesis == b')':
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return None
+
+
+def _count_module_instances(buffer, start, end, instance_pattern):
+    '''Instances of each module (whose names instance_pattern matches) in buffer[start:end]'''
+
+    children = Counter()
+    parsed = start
+    for match in _outside_skipped(instance_pattern.finditer(buffer, start, end), buffer, start, end):
+        child = match.start()
+        if child < parsed or (child and buffer[child - 1] in _INSTANCE_PREFIX_BYTES):
+            continue  # In the ports of the previous instance, or part of a longer (or hierarchical) name
+
+        position = match.end()
+        parameters = _PARAMETERS_PATTERN.match(buffer, position, end)
+        if parameters is not None:
+            position = _skip_parentheses(buffer, parameters.end() - 1, end)
+            if position is None:
+                continue
+        # Each name in "child name (ports), name [7:0] (ports);" is an instance (& instance arrays hold one per index)
+        instances = 0
+        while (name := _INSTANCE_NAME_PATTERN.match(buffer, position, end)) is not None:
+            msb, lsb = name.groups()
+            instances += abs(int(msb) - int(lsb)) + 1 if msb and lsb else 1
+            position = _skip_parentheses(buffer, name.end() - 1, end)
+            separator = None if position is None else _INSTANCE_SEPARATOR_PATTERN.match(buffer, position, end)
+            if separator is None:
+                break
+            position = separator.end()
+        if instances:
+            children[match.group().decode()] += instances
+            parsed = end if position is None else position
+    return children
+
+
+def _count_cells_by_module(buffer, tracer=None, engine='structural'):
+    '''Count each cell type in every module of buffer, then roll the counts up the module hierarchy
+
+    Returns the cell counts of the whole design (every top-level module) & {module: (is_top, cell counts)}
+    '''
+
+    # Each module body is scanned once, no matter how many times it is instantiated
+    module_bodies = {}
+    module, body_start = None, 0
+    for match in _outside_skipped(_MODULE_PATTERN.finditer(buffer), buffer, 0, len(buffer)):
+        keyword = match.start()
+        is_end = buffer[max(keyword - 3, 0):keyword] == b'end'
+        if is_end or buffer[max(keyword - 5, 0):keyword] == b'macro':
+            keyword -= 3 if is_end else 5
+        if keyword > 0 and buffer[keyword - 1] in _IDENTIFIER_BYTES:
+            continue  # Part of a longer name
+        if is_end:
+            if module is not None:
+                module_bodies[module] = (body_start, keyword)
+            module = None
+            continue
+
+        name = _MODULE_NAME_PATTERN.match(buffer, match.end())
+        if name is None:
+            continue
+        if module is not None:
+            raise ValueError(f'Module {name.group(1).decode()} starts before module {module.decode()} ends')
+        module, body_start = name.group(1), name.end()
+    if module is not None:
+        module_bodies[module] = (body_start, len(buffer))
+
+    # Only instances of modules defined here matter (the rest are cells, primitives, or black boxes)
+    instance_pattern = None
+    if len(module_bodies) > 1:
+        instance_pattern = re.compile(b'(?:' + b'|'.join(map(re.escape, module_bodies)) + rb')(?=[\s#])')
+
+    module_counts = {}
+    module_instances = {}
+    instantiated = set()
+    for module, (start, end) in module_bodies.items():
+        module_counts[module.decode()] = _count_cells(buffer, start, end, tracer, engine)
+        children = Counter()
+        if instance_pattern is not None:
+            children = _count_module_instances(buffer, start, end, instance_pattern)
+        module_instances[module.decode()] = children
+        instantiated.update(children)
+
+    totals = _roll_up_modules(module_counts, module_instances)
+    design_counts = _new_cell_counts()
+    for module, counts in totals.items():
+        if module not in instantiated:
+            design_counts = _add_cell_counts(design_counts, counts)
+    return design_counts, {module: (module not in instantiated, counts) for module, counts in totals.items()}
+
+
+def _count_cells_by_module_in_file(filename, tracer=None, engine='structural'):
+    '''Count each cell type in every module of file (streamed inputs are read into memory whole)'''
+
+    if filename == '-':
+        file = sys.stdin.buffer
+        return _count_cells_by_module((_open_decompressed(file) or file).read(), tracer, engine)
+
+    with open(filename, 'rb') as file:
+        if not _is_mappable(file):
+            _advise_sequential(file)
+            with _open_decompressed(file) or file as stream:
+                return _count_cells_by_module(stream.read(), tracer, engine)
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmfile:
+            _advise_sequential(mmfile)
+            return _count_cells_by_module(mmfile, tracer, engine)
+
+
+def _scan_file(filename, start=0, end=None, verbose=False, hierarchy=False, engine='structural'):
+    '''Cell counts of bytes [start, end) of file, then those of each module in it (with hierarchy)
+    & the position a scan of the following bytes has to resume at
+
+    verbose is False, True (print each match, like -v), or a CellTracer
+    '''
+
+    # Verbose output is traced by whichever process scans (so pool workers print their own)
+    tracer = CellTracer(sys.stdout, 'verbose') if verbose is True else verbose or None
+    if tracer:
+        tracer.begin(filename)
+    modules, resume = None, None
+    if hierarchy:
+        counts, modules = _count_cells_by_module_in_file(filename, tracer, engine)
+    else:
+        counts, resume = _count_cells_in_file(filename, start, end, tracer, engine)
+    if tracer:
+        tracer.end()
+    return counts, modules, resume
+
+
+def _split_file(filename, split_size, engine='structural'):
+    '''Split file into byte ranges of about split_size bytes (each starting where a separate scan can)'''
+
+    split_size = max(split_size, _MIN_SPLIT_SIZE)
+    if filename == '-' or os.stat(filename).st_size <= split_size:
+        return [(0, None)]
+
+    ranges = []
+    with open(filename, 'rb') as file:
+        if not _is_mappable(file):
+            return [(0, None)]
+
+        size = os.fstat(file.fileno()).st_size
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmfile:
+            start = 0
+            while size - start > split_size:
+                boundary = _ENGINES[engine].next_boundary(mmfile, start + split_size)
+                if boundary is None or boundary >= size:
+                    break
+                ranges.append((start, boundary))
+                start = boundary
+    ranges.append((start, None))
+    return ranges
+
+
+# Incremental scans cut files into content-defined chunks: each is at least _CHUNK_SIZE bytes & ends at the first
+# boundary past that whose preceding _CHUNK_WINDOW bytes hash to a multiple of _CHUNK_MASK + 1 (or past
+# _MAX_CHUNK_SIZE), so an edit only changes the chunks around it & the ones after it keep their cached counts
+_CHUNK_SIZE = 1024 * 1024
+_MAX_CHUNK_SIZE = 4 * _CHUNK_SIZE
+_CHUNK_WINDOW = 32
+_CHUNK_MASK = 63
+
+
+def _chunk_buffer(buffer, engine='structural'):
+    '''Content-defined byte ranges of buffer (each starting where a separate scan can)'''
+
+    next_boundary = _ENGINES[engine].next_boundary
+    ranges = []
+    start, size = 0, len(buffer)
+    while size - start > _CHUNK_SIZE:
+        boundary = next_boundary(buffer, start + _CHUNK_SIZE)
+        while (boundary is not None and boundary - start < _MAX_CHUNK_SIZE
+               and zlib.crc32(buffer[boundary - _CHUNK_WINDOW:boundary]) & _CHUNK_MASK):
+            boundary = next_boundary(buffer, boundary + 1)
+        if boundary is None or boundary >= size:
+            break
+        ranges.append((start, boundary))
+        start = boundary
+    ranges.append((start, size))
+    return ranges
+
+
+# Bump whenever cached counts could differ for the same file (for example, a new counting rule)
+_CACHE_FORMAT = 2
+
+
+def _cell_table_fingerprint():
+    return hashlib.sha256(
+        repr((_CACHE_FORMAT, _CELL_NAMES, _CELL_SITES.tolist(), _CELL_TRANSISTORS.tolist())).encode()
+    ).hexdigest()[:16]
+
+
+_CELL_TABLE_FINGERPRINT = _cell_table_fingerprint()
+# Cached entries written per SQLite commit (an interrupted run keeps most of its work)
+_CACHE_COMMIT_INTERVAL = 100
+
+
+def _default_cache_dir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'cellstats')
+
+
+class ResultCache:
+    '''On-disk (SQLite) cache of each file's cell counts, keyed by file identity & the cell tables
+
+    Files are identified by path, size, mtime, & inode (or by a hash of their contents with hash_contents),
+    entries beyond max_size bytes are evicted least recently used first, & refresh ignores existing entries
+    (one cache may be shared by several threads, like the requests of a service)
+    '''
+
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024, hash_contents=False, refresh=False):
+        self.directory = directory or _default_cache_dir()
+        self.max_size = max_size
+        self.hash_contents = hash_contents
+        self.refresh = refresh
+        self._used = {}  # Key => time of last hit (written back on close)
+        self._uncommitted = 0
+        import sqlite3
+        import threading
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._database = sqlite3.connect(
+            os.path.join(self.directory, 'results.sqlite3'), timeout=60, check_same_thread=False
+        )
+        self._database.execute('PRAGMA journal_mode=WAL')
+        self._database.execute(
+            'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, counts BLOB NOT NULL, last_used REAL NOT NULL)'
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def key(self, filename, engine='structural'):
+        '''Identify the current contents of file (None if it cannot be cached, like stdin or a pipe)'''
+
+        if filename == '-':
+            return None
+        status = os.stat(filename)
+        if not stat.S_ISREG(status.st_mode):
+            return None
+
+        if self.hash_contents:
+            digest = hashlib.blake2b(digest_size=20)
+            with open(filename, 'rb') as file:
+                while chunk := file.read(_SCAN_WINDOW):
+                    digest.update(chunk)
+            return f'{_CELL_TABLE_FINGERPRINT}:{engine}:blake2b:{digest.hexdigest()}'
+        return (f'{_CELL_TABLE_FINGERPRINT}:{engine}:{os.path.realpath(filename)}:'
+                f'{status.st_size}:{status.st_mtime_ns}:{status.st_ino}')
+
+    def get(self, key):
+        '''Cached cell counts for key (or None)'''
+
+        if key is None or self.refresh:
+            return None
+        with self._lock:
+            row = self._database.execute('SELECT counts FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._used[key] = time.time()
+        return array('q', zlib.decompress(row[0]))
+
+    def put(self, key, counts):
+        if key is None:
+            return
+        blob = zlib.compress(counts.tobytes())
+        with self._lock:
+            self._database.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)', (key, blob, time.time()))
+            self._uncommitted += 1
+            if self._uncommitted >= _CACHE_COMMIT_INTERVAL:
+                self._database.commit()
+                self._uncommitted = 0
+
+    def commit(self):
+        '''Record hits, evict least recently used entries beyond max_size, & commit (the cache stays open)'''
+
+        with self._lock:
+            self._database.executemany(
+                'UPDATE results SET last_used = ? WHERE key = ?', ((used, key) for key, used in self._used.items())
+            )
+            self._used.clear()
+
+            (size,) = self._database.execute('SELECT COALESCE(SUM(LENGTH(counts)), 0) FROM results').fetchone()
+            if size > self.max_size:
+                evicted = []
+                for key, length in self._database.execute(
+                    'SELECT key, LENGTH(counts) FROM results ORDER BY last_used'
+                ):
+                    if size <= self.max_size:
+                        break
+                    evicted.append((key,))
+                    size -= length
+                self._database.executemany('DELETE FROM results WHERE key = ?', evicted)
+
+            self._database.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        '''Record hits, evict least recently used entries beyond max_size, commit, & close'''
+
+        self.commit()
+        self._database.close()
+
+
+# Cell libraries (LEF for sizes, SPICE/CDL for transistor counts) & where the PDK keeps them by name
+_LIBRARY_NAMES = ('hd', 'hdll', 'hs', 'ms', 'ls', 'lp', 'hvl')
+_LEF_EXTENSIONS = ('.lef', '.tlef')
+_SPICE_EXTENSIONS = ('.spice', '.sp', '.cdl')
+_LEF_STATEMENT_PATTERN = re.compile(
+    rb'^[ \t]*(MACRO|SITE|CLASS|SIZE|END)\b[ \t]*([^;\n]*?)[ \t]*;?[ \t]*\r?$', re.MULTILINE
+)
+_SPICE_STATEMENT_PATTERN = re.compile(
+    rb'^[ \t]*(?:\.subckt[ \t]+(\S+)|(\.ends)\b|(m|x[^\n]*fet)[^\n]*)', re.IGNORECASE | re.MULTILINE
+)
+# LEF classes of cells that only fill space, tie wells, or protect gates (named like fillers otherwise)
+_FILLER_CLASSES = {b'CORE SPACER', b'CORE WELLTAP', b'CORE ANTENNACELL', b'ENDCAP'}
+_FILLER_NAME_PATTERN = re.compile(rb'__(?:decap|fill|tap|diode|fakediode|macro_sparecell)')
+# Parsed libraries are cached as: header, sites & transistors ("q" arrays), filler flags ("B" array), areas ("d"
+# array), names
+_LIBRARY_CACHE_FORMAT = 4
+_LIBRARY_CACHE_HEADER = struct.Struct('<4sHI')  # Magic, format, number of cells
+
+
+def _cell_table():
+    '''The cell tables in use (as _use_cell_table() takes them)'''
+
+    return _CELL_NAMES, _CELL_SITES, _CELL_TRANSISTORS, _FILLER_CELL_COUNT, _CELL_AREAS
+
+
+def _use_cell_table(names, sites, transistors, filler_count, areas):
+    '''Count against these cell tables from now on (fillers first, then regular cells)'''
+
+    global _CELL_NAMES, _CELL_IDS, _CELL_SITES, _CELL_TRANSISTORS, _FILLER_CELL_COUNT, _CELL_AREAS
+    global _CELL_TABLE_FINGERPRINT
+    _CELL_NAMES = list(names)
+    _CELL_IDS = {cell: cell_id for cell_id, cell in enumerate(_CELL_NAMES)}
+    _CELL_SITES = array('q', sites)
+    _CELL_TRANSISTORS = array('q', transistors)
+    _FILLER_CELL_COUNT = filler_count
+    _CELL_AREAS = array('d', areas)
+    _CELL_TABLE_FINGERPRINT = _cell_table_fingerprint()
+
+
+def _builtin_library():
+    return {
+        **{cell: (True, sites, transistors, sites * _SITE_AREA_UM2)
+           for cell, (sites, transistors) in _FILLER_CELLS.items()},
+        **{cell: (False, sites, transistors, sites * _SITE_AREA_UM2)
+           for cell, (sites, transistors) in _REGULAR_CELLS.items()},
+    }
+
+
+def _library_files(library):
+    '''LEF & SPICE files of a library (a name like "hd" under $PDK_ROOT, a directory, or a single file)'''
+
+    if library in _LIBRARY_NAMES:
+        if not os.environ.get('PDK_ROOT'):
+            raise ValueError(f'Set PDK_ROOT to load library {library} (or pass the directory of the library)')
+        library = os.path.join(os.environ['PDK_ROOT'], os.environ.get('PDK', 'sky130A'), 'libs.ref',
+                               f'sky130_fd_sc_{library}')
+
+    if os.path.isdir(library):
+        filenames = sorted(
+            os.path.join(directory, filename)
+            for directory, _, filenames in os.walk(library)
+            for filename in filenames
+        )
+    elif os.path.exists(library):
+        filenames = [library]
+    else:
+        raise ValueError(f'Cell library {library} does not exist')
+
+    lef_files = [filename for filename in filenames if filename.lower().endswith(_LEF_EXTENSIONS)]
+    spice_files = [filename for filename in filenames if filename.lower().endswith(_SPICE_EXTENSIONS)]
+    if not lef_files:
+        raise ValueError(f'Cell library {library} has no LEF file')
+    return lef_files, spice_files
+
+
+def _parse_lef(data, site_sizes, macros):
+    '''Collect SITE sizes & each MACRO's (class, width, height, site) from LEF text'''
+
+    block, name = None, None
+    for match in _LEF_STATEMENT_PATTERN.finditer(data):
+        keyword, value = match.groups()
+        if keyword == b'END':
+            if value == name:
+                block, name = None, None
+        elif block is None:
+            if keyword in (b'MACRO', b'SITE') and value:
+                block, name = keyword, value
+                if keyword == b'MACRO':
+                    macros[name] = [None, None, None, None]
+        elif keyword == b'SIZE':
+            width, _, height = value.partition(b'BY')
+            if block == b'SITE':
+                site_sizes[name] = (float(width), float(height))
+            else:
+                macros[name][1:3] = float(width), float(height)
+        elif block == b'MACRO' and keyword == b'CLASS' and macros[name][0] is None:
+            macros[name][0] = b' '.join(value.split())
+        elif block == b'MACRO' and keyword == b'SITE' and macros[name][3] is None:
+            macros[name][3] = value
+
+
+def _parse_spice(data, transistors):
+    '''Count the transistors (M or X...fet lines) of each .subckt in SPICE/CDL text'''
+
+    subckt = None
+    for match in _SPICE_STATEMENT_PATTERN.finditer(data):
+        if match.group(1) is not None:
+            subckt = match.group(1)
+            transistors[subckt] = 0
+        elif match.group(2) is not None:
+            subckt = None
+        elif subckt is not None:
+            transistors[subckt] += 1
+
+
+def _parse_library(lef_files, spice_files):
+    '''Map each cell of a library to (is_filler, sites, transistors, area in µm²)'''
+
+    site_sizes, macros, transistors = {}, {}, {}
+    for filename in lef_files:
+        with open(filename, 'rb') as file:
+            _parse_lef(file.read(), site_sizes, macros)
+    for filename in spice_files:
+        with open(filename, 'rb') as file:
+            _parse_spice(file.read(), transistors)
+
+    standard_cells = {
+        cell: macro for cell, macro in macros.items()
+        if cell.startswith(b'sky130_') and macro[3] is not None and macro[1] is not None
+    }
+    for cell, (_, _, _, site) in standard_cells.items():
+        if site not in site_sizes:
+            raise ValueError(f'Site {site.decode()} of {cell.decode()} is not defined (add the technology LEF)')
+    # Rows are as high as the lowest core site (so cells on a double-height site like unithddbl span two rows)
+    row_height = min((site_sizes[macro[3]][1] for macro in standard_cells.values()), default=1.0)
+
+    builtin = _builtin_library()
+    cells = {}
+    for cell, (cell_class, width, height, site) in standard_cells.items():
+        site_width = site_sizes[site][0]
+        sites = round(width / site_width) * max(round(height / row_height), 1)
+        is_filler = cell_class in _FILLER_CLASSES or _FILLER_NAME_PATTERN.search(cell) is not None
+        cell_transistors = transistors.get(cell, builtin.get(cell, (False, 0, 0, 0.0))[2])
+        cells[cell] = (is_filler, sites, cell_transistors, width * height)
+    return cells
+
+
+def _load_library(library, cache_dir=None):
+    '''Map each cell of a library to (is_filler, sites, transistors, area in µm²), parsing its files only once'''
+
+    if library == 'builtin':
+        return _builtin_library()
+
+    lef_files, spice_files = _library_files(library)
+    if cache_dir is None:
+        return _parse_library(lef_files, spice_files)
+
+    # Any change to the files (or to their list) gives a new cache file
+    identity = [_LIBRARY_CACHE_FORMAT]
+    for filename in (*lef_files, *spice_files):
+        file_stat = os.stat(filename)
+        identity.append((os.path.realpath(filename), file_stat.st_size, file_stat.st_mtime_ns))
+    digest = hashlib.sha256(repr(identity).encode()).hexdigest()[:16]
+    cache_filename = os.path.join(cache_dir, f'library-{digest}.bin')
+    try:
+        with open(cache_filename, 'rb') as file:
+            data = file.read()
+        magic, cache_format, count = _LIBRARY_CACHE_HEADER.unpack_from(data)
+        if magic == b'CSLB' and cache_format == _LIBRARY_CACHE_FORMAT:
+            offset = _LIBRARY_CACHE_HEADER.size
+            sites, transistors, fillers, areas = array('q'), array('q'), array('B'), array('d')
+            for values in (sites, transistors, fillers, areas):
+                size = values.itemsize * count
+                values.frombytes(data[offset:offset + size])
+                offset += size
+            names = data[offset:].split(b'\0') if count else []
+            return dict(zip(names, zip(map(bool, fillers), sites, transistors, areas)))
+    except (OSError, struct.error, ValueError):
+        pass  # Missing, truncated, or outdated (parse again)
+
+    cells = _parse_library(lef_files, spice_files)
+    data = b''.join((
+        _LIBRARY_CACHE_HEADER.pack(b'CSLB', _LIBRARY_CACHE_FORMAT, len(cells)),
+        array('q', (sites for _, sites, _, _ in cells.values())).tobytes(),
+        array('q', (transistors for _, _, transistors, _ in cells.values())).tobytes(),
+        array('B', (is_filler for is_filler, _, _, _ in cells.values())).tobytes(),
+        array('d', (area for _, _, _, area in cells.values())).tobytes(),
+        b'\0'.join(cells),
+    ))
+    os.makedirs(cache_dir, exist_ok=True)
+    temporary_filename = f'{cache_filename}.{os.getpid()}'
+    with open(temporary_filename, 'wb') as file:
+        file.write(data)
+    os.replace(temporary_filename, cache_filename)
+    return cells
+
+
+def use_cell_libraries(libraries, cache_dir=None):
+    '''Count cells of these libraries from now on (later libraries win for cells that several define)
+
+    Each library is "builtin" (the sky130_fd_sc_hd tables above), a name like "hd" or "hdll" (found under
+    $PDK_ROOT/$PDK/libs.ref), a library directory, or a LEF file; parsed libraries are cached in cache_dir
+    '''
+
+    cells = {}
+    for library in libraries:
+        cells.update(_load_library(library, cache_dir))
+    fillers = [cell for cell, (is_filler, _, _, _) in cells.items() if is_filler]
+    regulars = [cell for cell, (is_filler, _, _, _) in cells.items() if not is_filler]
+    names = [*fillers, *regulars]
+    _use_cell_table(
+        names,
+        (cells[cell][1] for cell in names),
+        (cells[cell][2] for cell in names),
+        len(fillers),
+        (cells[cell][3] for cell in names),
+    )
+
+
+def _timed_scan_file(filename, start=0, end=None, verbose=False, hierarchy=False, engine='structural'):
+    '''_scan_file() & how long it took (wall & CPU seconds, in the process that scanned)'''
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = _scan_file(filename, start, end, verbose, hierarchy, engine)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+class ScanStats:
+    '''Opt-in instrumentation: bytes, matches, & where the time went for each file, then for the whole run
+
+    Each file's record is also returned as file_statistics['scan_stats'] (so callers can add their 'output_s')
+    '''
+
+    def __init__(self):
+        self.files = []
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+
+    def add_file(self, filename, counts, scan_s=0.0, scan_cpu_s=0.0, aggregate_s=0.0, cached=False):
+        size = None if filename == '-' else os.stat(filename).st_size  # On disk (so compressed, if it is)
+        record = {
+            'filename': filename,
+            'bytes': size,
+            'matches': sum(counts),
+            'cached': cached,
+            'scan_s': scan_s,
+            'scan_cpu_s': scan_cpu_s,
+            'aggregate_s': aggregate_s,
+            'output_s': 0.0,
+            'mb_per_s': size / 1e6 / scan_s if size and scan_s else None,
+        }
+        self.files.append(record)
+        return record
+
+    def summary(self):
+        '''Totals of the run so far (CPU time & peak RSS include pool workers once they have exited)'''
+
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        peak_rss_mb = None
+        if resource is not None:
+            own, workers = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu += workers.ru_utime + workers.ru_stime
+            # ru_maxrss is in KiB on Linux (& bytes on macOS)
+            peak_rss_mb = max(own.ru_maxrss, workers.ru_maxrss) / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+        size = sum(record['bytes'] or 0 for record in self.files)
+        return {
+            'files': len(self.files),
+            'bytes': size,
+            'matches': sum(record['matches'] for record in self.files),
+            'cached': sum(record['cached'] for record in self.files),
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'mb_per_s': size / 1e6 / wall if wall else None,
+            'scan_s': sum(record['scan_s'] for record in self.files),
+            'aggregate_s': sum(record['aggregate_s'] for record in self.files),
+            'output_s': sum(record['output_s'] for record in self.files),
+            'peak_rss_mb': peak_rss_mb,
+        }
+
+    def to_json(self):
+        return {'files': self.files, 'summary': self.summary()}
+
+    def write(self, file):
+        '''Write one "key=value" line per file, then one for the run'''
+
+        for record in (*self.files, {'filename': '(total)', **self.summary()}):
+            print(' '.join(
+                f'{key}={value:.6g}' if isinstance(value, float) else f'{key}={value}'
+                for key, value in record.items()
+            ), file=file)
+
+
+def _merge_range_counts(filename, ranges, results, engine='structural'):
+    '''Add up the cell counts of each range of file (rescanning any range that the previous scan ran into)'''
+
+    counts = _new_cell_counts()
+    resume = 0
+    for (start, end), (range_counts, _, range_resume) in zip(ranges, results):
+        if resume > start:
+            # For example, a block comment across the boundary (rare, as ranges start after a statement)
+            range_counts, range_resume = _count_cells_in_file(filename, resume, end, engine=engine)
+            range_resume = max(range_resume, resume)
+        counts = _add_cell_counts(counts, range_counts)
+        resume = range_resume
+    return counts
+
+
+def _plan_chunks(filename, cache, engine='structural'):
+    '''Content-defined chunks of file as [(start, end, cache key, cached cell counts or None)]
+
+    (None if file cannot be chunked, like stdin or a compressed file)
+    '''
+
+    if filename == '-':
+        return None
+    with open(filename, 'rb') as file:
+        if not _is_mappable(file):
+            return None
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmfile:
+            _advise_sequential(mmfile)
+            chunks = []
+            for start, end in _chunk_buffer(mmfile, engine):
+                digest = hashlib.blake2b(mmfile[start:end], digest_size=20).hexdigest()
+                key = f'{_CELL_TABLE_FINGERPRINT}:{engine}:chunk:{digest}'
+                chunks.append((start, end, key, cache.get(key)))
+    return chunks
+
+
+def _cached_chunk_results(chunks):
+    # A chunk is only cached if its scan did not run into the next one, so the next scan resumes at its end
+    return [None if counts is None else (counts, None, end) for _, end, _, counts in chunks]
+
+
+def _merge_chunk_counts(filename, chunks, results, cache, engine='structural'):
+    '''Add up the cell counts of each chunk of file (like _merge_range_counts()) & cache those of new chunks'''
+
+    for (_, end, key, cached_counts), (counts, _, resume) in zip(chunks, results):
+        if cached_counts is None and resume <= end:
+            cache.put(key, counts)
+    return _merge_range_counts(filename, [chunk[:2] for chunk in chunks], results, engine)
+
+
+def _scan_chunks(filename, chunks, cache, scan=_scan_file, engine='structural'):
+    '''Like scan(filename), but only scanning the chunks of file that are not cached yet'''
+
+    results = _cached_chunk_results(chunks)
+    scan_s = scan_cpu_s = 0.0
+    for index, (start, end, _, _) in enumerate(chunks):
+        if results[index] is None:
+            result = scan(filename, start, end, engine=engine)
+            if scan is _timed_scan_file:
+                result, wall, cpu = result
+                scan_s += wall
+                scan_cpu_s += cpu
+            results[index] = result
+
+    result = _merge_chunk_counts(filename, chunks, results, cache, engine), None, None
+    return (result, scan_s, scan_cpu_s) if scan is _timed_scan_file else result
+
+
+def get_sky130_cell_statistics_from_file(filename, verbose=False, jobs=1, per_cell=False, cache=None, hierarchy=False,
+                                         engine='structural', incremental=False):
+    '''Count Skywater 130nm cells, sites, & transistors in file (with fillers seperately)
+
+    With per_cell, file_statistics['per_cell'] maps each cell type found to (count, sites, transistors)
+    With hierarchy, each module is counted once per instance & file_statistics['modules'] maps each module
+    to its own statistics (including its submodules)
+    The "structural" engine only counts cells in instantiation position, "regex" counts every sky130_* token,
+    & "vocabulary" counts every sky130_* token too (unknown cells are counted in file_statistics['unknown_cells'])
+    With incremental (& a cache), only the chunks of file that changed since it was last scanned are rescanned
+    '''
+
+    split_size = None
+    if jobs != 1 and filename != '-' and not hierarchy:
+        # Split into one range per worker so a single huge file can use every core
+        jobs = jobs or os.cpu_count() or 1
+        split_size = -(-os.stat(filename).st_size // jobs)
+    return next(get_sky130_cell_statistics_from_files(
+        [filename], verbose, jobs, split_size=split_size, per_cell=per_cell, cache=cache, hierarchy=hierarchy,
+        engine=engine, incremental=incremental,
+    ))
+
+
+def get_sky130_cell_histogram_from_file(filename, verbose=False, jobs=1, cache=None, engine='structural'):
+    '''Map each Skywater 130nm cell type in file to its (count, sites, transistors)'''
+
+    file_statistics = get_sky130_cell_statistics_from_file(filename, verbose, jobs, True, cache, engine=engine)
+    return file_statistics['per_cell']
+
+
+# Netlists picked from directories (each may also be compressed, for example "gate-level.v.gz")
+_NETLIST_EXTENSIONS = ('.v', '.vg', '.gv', '.sv')
+_COMPRESSED_EXTENSIONS = ('', '.gz', '.xz', '.bz2', '.zst')
+_GLOB_CHARACTERS = re.compile(r'[*?[]')
+# Most files prefetched at once (& threads prefetching them)
+_READAHEAD_THREADS = 8
+
+
+def _walk_netlists(directory, extensions=_NETLIST_EXTENSIONS, unreadable_ok=False):
+    '''Files under directory (recursively, in name order) ending in one of extensions (optionally compressed)
+
+    With unreadable_ok, directories that cannot be listed are yielded themselves (to fail when scanned)
+    '''
+
+    suffixes = tuple(extension + compressed for extension in extensions for compressed in _COMPRESSED_EXTENSIONS)
+    stack = [directory]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name)
+        except OSError:
+            if not unreadable_ok:
+                raise
+            yield directory
+            continue
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(suffixes):
+                yield entry.path
+        # Symbolic links to directories are not followed (they could loop)
+        stack.extend(entry.path for entry in reversed(entries) if entry.is_dir(follow_symlinks=False))
+
+
+def expand_netlist_paths(paths, extensions=_NETLIST_EXTENSIONS, missing_ok=False):
+    '''Yield the netlists named by paths: files as they are, directories walked recursively, & glob patterns
+    (like "runs/*/results/**/*.v") expanded by Python (so they never hit the shell's argument limit)
+
+    Paths are expanded as the result is consumed, but all the matches of a pattern are collected (& sorted) at once
+
+    Files found in directories are filtered by extension; files named (or matched by a pattern) are not
+    With missing_ok, paths that name nothing (& directories that cannot be listed) are yielded as they are (to
+    fail when scanned) instead of raising
+    '''
+
+    for path in paths:
+        if path == '-' or os.path.isfile(path):
+            yield path
+            continue
+        if os.path.isdir(path):
+            yield from _walk_netlists(path, extensions, missing_ok)
+            continue
+        is_pattern = _GLOB_CHARACTERS.search(path) is not None
+        matches = sorted(glob.iglob(path, recursive=True)) if is_pattern else []
+        if not matches:
+            if missing_ok:
+                yield path
+                continue
+            if is_pattern:
+                raise FileNotFoundError(f'No file matches {path!r}')
+            raise FileNotFoundError(f'No such file or directory: {path!r}')
+        for match in matches:
+            if os.path.isdir(match):
+                yield from _walk_netlists(match, extensions, missing_ok)
+            else:
+                yield match
+
+
+def _prefetch(filename):
+    '''Ask the kernel to start reading file into the page cache (without waiting for it)'''
+
+    try:
+        descriptor = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return  # Reported when the file is scanned
+    try:
+        os.posix_fadvise(descriptor, 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+def _read_ahead(filenames, depth, cache=None, engine='structural'):
+    '''Yield each filename, its cache key, & its cached counts (or the error looking them up raised), while the next
+    depth files missing from the optional ResultCache are prefetched by background threads
+    '''
+
+    def look_up(filename):
+        if cache is None:
+            return filename, None, None, None
+        try:
+            key = cache.key(filename, engine)
+            return filename, key, cache.get(key), None
+        except _file_errors() as error:
+            return filename, None, None, error  # Raised in its turn
+
+    if depth <= 0 or not hasattr(os, 'posix_fadvise'):
+        yield from map(look_up, filenames)
+        return
+
+    upcoming = deque()
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(depth, _READAHEAD_THREADS)) as executor:
+        for filename in filenames:
+            upcoming.append(look_up(filename))
+            # Cached files are never read (& those that cannot be looked up fail), so only the others are prefetched
+            _, _, counts, error = upcoming[-1]
+            if filename != '-' and counts is None and error is None:
+                executor.submit(_prefetch, filename)
+            if len(upcoming) > depth:
+                yield upcoming.popleft()
+        yield from upcoming
+
+
+# Files queued per worker (keeps huge file lists streaming in constant memory)
+_PENDING_FILES_PER_JOB = 4
+
+
+def _file_errors():
+    '''What fails a single file (with keep_going) rather than the whole run: unreadable or corrupt files, missing
+    decompressors, & malformed hierarchies
+    '''
+
+    # Only called once an exception is raised (& lzma is imported already if an xz file raised it)
+    import lzma
+    return OSError, EOFError, ImportError, KeyError, ValueError, lzma.LZMAError, zlib.error
+
+
+def _failed_file_statistics(filename, error):
+    '''The statistics of a file that could not be scanned: only its filename & a one-line error message'''
+
+    return CellStatistics(filename, error=f'{type(error).__name__}: {error}')
+
+
+def iter_sky130_cell_statistics(filenames, verbose=False, jobs=None, keep_order=False, split_size=None,
+                                per_cell=False, cache=None, hierarchy=False, engine='structural', stats=None,
+                                readahead=0, executor=None, incremental=False, keep_going=False):
+    '''Count Skywater 130nm cells, sites, & transistors in many files, lazily yielding a CellStatistics for each one
+    as it finishes (filenames is only consumed as scanning progresses, so memory stays constant however many)
+
+    Files larger than split_size bytes are scanned as several byte ranges in parallel, then merged
+    (& files found in the optional ResultCache are not scanned at all)
+    With an optional ScanStats, each file's bytes, matches, & time are recorded too
+    verbose may also be a CellTracer (which traces the files one at a time, in order)
+    With readahead, the next readahead files are prefetched into the page cache while earlier ones are scanned
+    An optional ProcessPoolExecutor (whose workers use the current cell tables) is shared instead of starting one
+    With incremental, files missing from the cache are cut into content-defined chunks (cached one by one), so a
+    file edited since its last scan only has its changed chunks rescanned (instead of every byte)
+    With keep_going, a file that cannot be scanned (unreadable, corrupt, or with a malformed hierarchy) yields a
+    result with its error instead of raising, & the other files are still scanned (unknown sky130_* cells are
+    counted in unknown_cells instead, with any engine)
+    '''
+
+    if engine not in _ENGINES:
+        raise ValueError(f'Unknown engine {engine!r} (expected one of: {", ".join(_ENGINES)})')
+    jobs = jobs or os.cpu_count() or 1
+    if isinstance(verbose, CellTracer):
+        jobs = 1
+    if hierarchy:
+        # Modules are parsed from whole files (& the cache only holds flat counts)
+        split_size, cache = None, None
+    scan = _scan_file if stats is None else _timed_scan_file
+    # Chunks are only traced when they are rescanned, so verbose output always scans whole files
+    incremental = incremental and cache is not None and not verbose
+    filenames = _read_ahead(filenames, readahead, cache, engine)
+    if jobs == 1:
+        for filename, key, counts, error in filenames:
+            try:
+                if error is not None:
+                    raise error
+                modules = None
+                cached, scan_s, scan_cpu_s = counts is not None, 0.0, 0.0
+                if counts is None:
+                    chunks = _plan_chunks(filename, cache, engine) if incremental else None
+                    if chunks is None:
+                        result = scan(filename, verbose=verbose, hierarchy=hierarchy, engine=engine)
+                    else:
+                        result = _scan_chunks(filename, chunks, cache, scan, engine)
+                    if stats is not None:
+                        result, scan_s, scan_cpu_s = result
+                    counts, modules, _ = result
+                    if cache:
+                        cache.put(key, counts)
+                if stats is None:
+                    file_statistics = CellStatistics.from_counts(filename, counts, per_cell, modules)
+                else:
+                    aggregate_start = time.perf_counter()
+                    file_statistics = CellStatistics.from_counts(filename, counts, per_cell, modules)
+                    file_statistics.scan_stats = stats.add_file(
+                        filename, counts, scan_s, scan_cpu_s, time.perf_counter() - aggregate_start, cached
+                    )
+            except _file_errors() as error:
+                if not keep_going:
+                    raise
+                file_statistics = _failed_file_statistics(filename, error)
+            yield file_statistics
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_use_cell_table, initargs=_cell_table())
+    pending = {}  # Future => (index of the file it scans, index of the range)
+    scanning = {}  # Index => [filename, ranges, results of each range, ranges left, cache key, scan wall & CPU time,
+    #                          chunks (when incremental)]
+    finished = {}  # Index => statistics (waiting for their turn when keeping order)
+    next_index = 0
+    max_files = jobs * _PENDING_FILES_PER_JOB
+    try:
+        filenames = enumerate(filenames)
+        while True:
+            for index, (filename, key, counts, error) in filenames:
+                try:
+                    if error is not None:
+                        raise error
+                    modules = None
+                    cached, scan_s, scan_cpu_s = counts is not None, 0.0, 0.0
+                    chunks = _plan_chunks(filename, cache, engine) if counts is None and incremental else None
+                    if chunks is not None and all(chunk[3] is not None for chunk in chunks):
+                        counts = _merge_chunk_counts(filename, chunks, _cached_chunk_results(chunks), cache, engine)
+                        cache.put(key, counts)
+                        cached = True
+                    if counts is None and filename == '-':
+                        # Pool workers do not share our stdin
+                        result = scan(filename, verbose=verbose, hierarchy=hierarchy, engine=engine)
+                        if stats is not None:
+                            result, scan_s, scan_cpu_s = result
+                        counts, modules, _ = result
+                    if counts is not None:
+                        aggregate_start = time.perf_counter()
+                        finished[index] = CellStatistics.from_counts(filename, counts, per_cell, modules)
+                        if stats is not None:
+                            finished[index].scan_stats = stats.add_file(
+                                filename, counts, scan_s, scan_cpu_s, time.perf_counter() - aggregate_start, cached
+                            )
+                        continue
+
+                    if chunks is not None:
+                        ranges, results = [chunk[:2] for chunk in chunks], _cached_chunk_results(chunks)
+                    else:
+                        ranges = _split_file(filename, split_size, engine) if split_size else [(0, None)]
+                        results = [None] * len(ranges)
+                    scanning[index] = [filename, ranges, results, results.count(None), key, 0.0, 0.0, chunks]
+                    for range_index, (start, end) in enumerate(ranges):
+                        if results[range_index] is None:
+                            future = executor.submit(scan, filename, start, end, verbose, hierarchy, engine)
+                            pending[future] = (index, range_index)
+                except _file_errors() as error:
+                    if not keep_going:
+                        raise
+                    scanning.pop(index, None)
+                    finished[index] = _failed_file_statistics(filename, error)
+                if len(scanning) + len(finished) >= max_files:
+                    break
+            if not pending and not finished:
+                return
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED) if pending else ((), ())
+            for future in done:
+                index, range_index = pending.pop(future)
+                if index not in scanning:
+                    continue  # Another range of the file failed
+                merged = scanning[index]
+                try:
+                    result = future.result()
+                    if stats is not None:
+                        result, scan_s, scan_cpu_s = result
+                        merged[5] += scan_s
+                        merged[6] += scan_cpu_s
+                    merged[2][range_index] = result
+                    merged[3] -= 1
+                    if merged[3] == 0:
+                        filename, ranges, results, _, key, scan_s, scan_cpu_s, chunks = scanning.pop(index)
+                        aggregate_start = time.perf_counter()
+                        if chunks is None:
+                            counts = _merge_range_counts(filename, ranges, results, engine)
+                        else:
+                            counts = _merge_chunk_counts(filename, chunks, results, cache, engine)
+                        if cache:
+                            cache.put(key, counts)
+                        finished[index] = CellStatistics.from_counts(filename, counts, per_cell, results[0][1])
+                        if stats is not None:
+                            finished[index].scan_stats = stats.add_file(
+                                filename, counts, scan_s, scan_cpu_s, time.perf_counter() - aggregate_start
+                            )
+                except _file_errors() as error:
+                    if not keep_going:
+                        raise
+                    scanning.pop(index, None)
+                    finished[index] = _failed_file_statistics(merged[0], error)
+                    for other_future, (other_index, _) in pending.items():
+                        if other_index == index:
+                            other_future.cancel()
+
+            if keep_order:
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+            else:
+                yield from finished.values()
+                finished.clear()
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+        else:
+            for future in pending:
+                future.cancel()
+
+
+def get_sky130_cell_statistics_from_files(filenames, verbose=False, jobs=None, keep_order=False, split_size=None,
+                                          per_cell=False, cache=None, hierarchy=False, engine='structural', stats=None,
+                                          readahead=0, executor=None, incremental=False, keep_going=False):
+    '''Like iter_sky130_cell_statistics(), but yielding statistics dicts (& {'filename': ..., 'error': ...} for the
+    files that failed with keep_going)
+    '''
+
+    results = iter_sky130_cell_statistics(
+        filenames, verbose, jobs, keep_order, split_size, per_cell, cache, hierarchy, engine, stats, readahead,
+        executor, incremental, keep_going,
+    )
+    try:
+        for result in results:
+            yield result._asdict()
+    finally:
+        results.close()  # Stops its workers right away if we are closed early
+
+
+class BatchJournal:
+    '''Append-only JSONL journal of the files a batch has finished, so an interrupted batch resumes where it stopped
+
+    Its first line holds the options of the batch (a journal only resumes a batch with the same options), then each
+    line holds the statistics of a file, flushed as soon as it is added; files that failed are not journaled (so
+    they are retried) & neither is stdin
+    '''
+
+    def __init__(self, filename, options):
+        self.filename = filename
+        self.finished = {}  # Filename => statistics
+        options = json.loads(json.dumps(options))  # As read back (tuples become lists)
+        end = 0
+        if os.path.exists(filename):
+            with open(filename, 'rb') as file:
+                for number, line in enumerate(file):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # A line cut short when the batch was interrupted (rewritten below)
+                    if number == 0:
+                        if record != options:
+                            raise ValueError(f'{filename} journals a batch with other options ({record}), '
+                                             f'remove it to start over')
+                    else:
+                        self.finished[record['filename']] = record
+                    end = file.tell()
+
+        self._file = open(filename, 'r+' if end else 'w')
+        self._file.truncate(end)
+        self._file.seek(end)
+        if not end:
+            self._write(options)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def add(self, file_statistics):
+        '''Record that a file is finished (unless it failed)'''
+
+        if 'error' in file_statistics or file_statistics['filename'] == '-':
+            return
+        record = {key: value for key, value in file_statistics.items() if key != 'scan_stats'}
+        self.finished[record['filename']] = record
+        self._write(record)
+
+    def close(self):
+        self._file.close()
+
+
+def get_sky130_cell_deltas(baseline_statistics, file_statistics):
+    '''How file_statistics differ from baseline_statistics (both with per_cell)
+
+    Returns a dict with the filename, the baseline's filename, the difference of each total (& of the area in µm²
+    as 'area_um2' & 'area_um2_with_filler'), & 'per_cell' mapping each cell type whose count changed to its
+    (baseline count, count, cells, sites, transistors, area) differences
+    Areas are each cell's own (its LEF size, for a loaded library), so they hold for any site
+    '''
+
+    baseline_cells, cells = baseline_statistics['per_cell'], file_statistics['per_cell']
+    per_cell = {}
+    area, filler_area = 0.0, 0.0
+    for cell in sorted(baseline_cells.keys() | cells.keys(), key=lambda cell: _CELL_IDS[cell.encode()]):
+        baseline_count, baseline_sites, baseline_transistors = baseline_cells.get(cell, (0, 0, 0))
+        count, sites, transistors = cells.get(cell, (0, 0, 0))
+        if count != baseline_count:
+            cell_id = _CELL_IDS[cell.encode()]
+            cell_area = (count - baseline_count) * _CELL_AREAS[cell_id]
+            if cell_id < _FILLER_CELL_COUNT:
+                filler_area += cell_area
+            else:
+                area += cell_area
+            per_cell[cell] = (baseline_count, count, count - baseline_count, sites - baseline_sites,
+                              transistors - baseline_transistors, round(cell_area, 4))
+
+    deltas = {'filename': file_statistics['filename'], 'baseline': baseline_statistics['filename']}
+    for key in (*_CSV_COLUMNS, 'unknown_cells'):
+        deltas[key] = file_statistics[key] - baseline_statistics[key]
+    deltas['area_um2'] = round(area, 4)
+    deltas['area_um2_with_filler'] = round(area + filler_area, 4)
+    deltas['per_cell'] = per_cell
+    return deltas
+
+
+def compare_sky130_cell_statistics_from_files(baseline, filenames, jobs=None, keep_order=False, **options):
+    '''Yield how each file differs from baseline (see get_sky130_cell_deltas()), scanning baseline only once
+
+    The other options are those of get_sky130_cell_statistics_from_files() (files are scanned in parallel)
+    '''
+
+    options['per_cell'] = True
+    baseline_statistics = next(get_sky130_cell_statistics_from_files([baseline], jobs=jobs, **options))
+    for file_statistics in get_sky130_cell_statistics_from_files(filenames, jobs=jobs, keep_order=keep_order,
+                                                                 **options):
+        yield get_sky130_cell_deltas(baseline_statistics, file_statistics)
+
+
+# Formats of CellMatrixWriter (by extension) & the size reserved for .npy headers (rewritten with the final shape)
+_MATRIX_FORMATS = {'.npy': 'npy', '.npz': 'npz', '.csv': 'csv', '.json': 'json'}
+_NPY_HEADER_SIZE = 128
+
+
+def _npy_header(descr, shape):
+    '''A .npy (format 1.0) header, padded to _NPY_HEADER_SIZE bytes'''
+
+    header = repr({'descr': descr, 'fortran_order': False, 'shape': shape}).encode()
+    header = header.ljust(_NPY_HEADER_SIZE - 11) + b'\n'
+    return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header
+
+
+def _csv_quote(text):
+    return '"' + text.replace('"', '""') + '"' if any(character in text for character in ',"\r\n') else text
+
+
+class CellMatrixWriter:
+    '''Write a runs x cell types matrix of counts (a row per file, columns in cell ID order with "unknown" last)
+
+    Rows are written as each file is added (so memory stays constant however many runs there are) as "npy"
+    (int64, with FILE.rows.txt & FILE.columns.txt labels), "npz" (counts, rows, & columns arrays, compressed),
+    a wide "csv", or "json" (by default, from the extension of filename); NumPy loads the first two
+    '''
+
+    def __init__(self, filename, format=None):
+        format = format or _MATRIX_FORMATS.get(os.path.splitext(filename)[1].lower())
+        if format not in _MATRIX_FORMATS.values():
+            raise ValueError(f'Unknown matrix format of {filename!r} (expected one of: {", ".join(_MATRIX_FORMATS)})')
+        self.filename = filename
+        self.format = format
+        self.columns = [*(cell.decode() for cell in _CELL_NAMES), 'unknown']
+        self.rows = 0
+        self._longest_row = 1
+
+        if format == 'csv':
+            self._file = open(filename, 'w', buffering=1024 * 1024)
+            self._file.write(','.join(['file', *self.columns]) + '\n')
+        elif format == 'json':
+            self._file = open(filename, 'w', buffering=1024 * 1024)
+            self._file.write(f'{{"columns": {json.dumps(self.columns)}, "rows": [')
+        else:
+            # Counts go straight to a .npy file (its header is rewritten with the number of rows on close)
+            stem = filename[:-len('.npy')] if format == 'npy' else f'{filename}.tmp'
+            self._file = open(f'{stem}.npy' if format == 'npy' else f'{stem}.counts', 'wb', buffering=1024 * 1024)
+            self._file.write(_npy_header(self._counts_descr(), (0, len(self.columns))))
+            self._labels = open(f'{stem}.rows.txt', 'w', buffering=1024 * 1024)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def _counts_descr():
+        return '<i8' if sys.byteorder == 'little' else '>i8'
+
+    def add(self, file_statistics):
+        '''Append the row of a file (whose statistics have per_cell)'''
+
+        counts = _new_cell_counts()
+        for cell, (count, _, _) in file_statistics['per_cell'].items():
+            counts[_CELL_IDS[cell.encode()]] = count
+        counts[_unknown_cell_id()] = file_statistics['unknown_cells']
+        filename = file_statistics['filename']
+
+        if self.format == 'csv':
+            self._file.write(f'{_csv_quote(filename)},{",".join(map(str, counts))}\n')
+        elif self.format == 'json':
+            self._file.write(f'{", " if self.rows else ""}{{"filename": {json.dumps(filename)}, '
+                             f'"counts": {json.dumps(counts.tolist())}}}')
+        else:
+            self._file.write(counts.tobytes())
+            self._labels.write(f'{filename}\n')
+            self._longest_row = max(self._longest_row, len(filename))
+        self.rows += 1
+
+    def close(self):
+        '''Finish the matrix (& its labels)'''
+
+        if self.format == 'json':
+            self._file.write(']}\n')
+        if self.format in ('csv', 'json'):
+            self._file.close()
+            return
+
+        self._file.seek(0)
+        self._file.write(_npy_header(self._counts_descr(), (self.rows, len(self.columns))))
+        self._file.close()
+        self._labels.close()
+        if self.format == 'npy':
+            with open(f'{self.filename[:-len(".npy")]}.columns.txt', 'w') as file:
+                file.write(''.join(f'{column}\n' for column in self.columns))
+            return
+
+        # Labels are stored as fixed-width UTF-32 strings (NumPy's "<U" arrays)
+        stem = f'{self.filename}.tmp'
+        import zipfile
+        with zipfile.ZipFile(self.filename, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            archive.write(f'{stem}.counts', 'counts.npy')
+            with archive.open('rows.npy', 'w', force_zip64=True) as entry, open(f'{stem}.rows.txt') as labels:
+                entry.write(_npy_header(f'<U{self._longest_row}', (self.rows,)))
+                for label in labels:
+                    entry.write(label[:-1].encode('utf-32-le').ljust(4 * self._longest_row, b'\0'))
+            longest_column = max(map(len, self.columns))
+            with archive.open('columns.npy', 'w') as entry:
+                entry.write(_npy_header(f'<U{longest_column}', (len(self.columns),)))
+                for column in self.columns:
+                    entry.write(column.encode('utf-32-le').ljust(4 * longest_column, b'\0'))
+        os.unlink(f'{stem}.counts')
+        os.unlink(f'{stem}.rows.txt')
+
+
+# DEF placement: the distance units, the die, & each standard cell component ("- name cell ... + PLACED ( x y ) N ;")
+_DEF_HEADER_PATTERN = re.compile(
+    rb'^\s*(?:UNITS\s+DISTANCE\s+MICRONS\s+(\d+)|DIEAREA((?:\s*\(\s*-?\d+\s+-?\d+\s*\))+)|(COMPONENTS)\s+\d+)\s*;',
+    re.MULTILINE,
+)
+_DEF_POINT_PATTERN = re.compile(rb'\(\s*(-?\d+)\s+(-?\d+)\s*\)')
+_DEF_COMPONENT_PATTERN = re.compile(
+    rb'-\s+\S+\s+(sky130_\w+)[^;+]*(?:\+(?!\s*(?:PLACED|FIXED|COVER)\b)[^;+]*)*'
+    rb'(?:\+\s*(?:PLACED|FIXED|COVER)\s*\(\s*(-?\d+)\s+(-?\d+)\s*\)[^;]*)?;'
+)
+_DEF_COMPONENTS_END_PATTERN = re.compile(rb'END\s+COMPONENTS\b')
+# Columns of the (cell, x, y) components matched (zip(*components) is much slower)
+_FIRST_ITEM, _SECOND_ITEM, _THIRD_ITEM = itemgetter(0), itemgetter(1), itemgetter(2)
+
+
+def _import_numpy():
+    # Only imported for placement grids (so other runs do not pay for it)
+    try:
+        import numpy
+    except ImportError:
+        raise ModuleNotFoundError('DEF placement grids require the "numpy" package') from None
+    return numpy
+
+
+class _PlacementGrid:
+    '''Sites placed in each tile of a grid over the die (non-filler & filler apart), added a block at a time'''
+
+    def __init__(self, die, columns, rows):
+        import numpy
+        self.die = die
+        self.columns, self.rows = columns, rows
+        self.counts = numpy.zeros(len(_CELL_NAMES) + 1, numpy.int64)
+        self.sites = numpy.zeros(columns * rows, numpy.int64)
+        self.filler_sites = numpy.zeros(columns * rows, numpy.int64)
+        self.area = numpy.zeros(columns * rows)  # Of the non-filler cells, in µm²
+        self._cell_sites = numpy.array([*_CELL_SITES, 0], numpy.int64)
+        self._cell_areas = numpy.array([*_CELL_AREAS, 0.0])
+
+    def add(self, components):
+        '''Add (cell, x, y) components (with empty x & y when unplaced, which are only counted)'''
+
+        import numpy
+        cells = map(_FIRST_ITEM, components)
+        cell_ids = numpy.fromiter(map(_CELL_IDS.get, cells, repeat(_unknown_cell_id())), numpy.int64, len(components))
+        self.counts += numpy.bincount(cell_ids, minlength=len(self.counts))
+
+        xs = numpy.array(list(map(_SECOND_ITEM, components)))
+        placed = xs != b''
+        cell_ids = cell_ids[placed]
+        xs = xs[placed].astype(numpy.int64)
+        ys = numpy.array(list(map(_THIRD_ITEM, components)))[placed].astype(numpy.int64)
+        x0, y0, x1, y1 = self.die
+        columns = numpy.clip((xs - x0) * self.columns // (x1 - x0), 0, self.columns - 1)
+        rows = numpy.clip((ys - y0) * self.rows // (y1 - y0), 0, self.rows - 1)
+        tiles = rows * self.columns + columns
+        sites = self._cell_sites[cell_ids]
+        is_filler = cell_ids < _FILLER_CELL_COUNT
+        for grid, selected in ((self.sites, ~is_filler), (self.filler_sites, is_filler)):
+            grid += numpy.bincount(tiles[selected], sites[selected], len(grid)).astype(numpy.int64)
+        self.area += numpy.bincount(tiles[~is_filler], self._cell_areas[cell_ids[~is_filler]], len(self.area))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.sites += other.sites
+        self.filler_sites += other.filler_sites
+        self.area += other.area
+
+    def cell_area(self, with_filler=False):
+        '''Area of the cells counted (placed or not) in µm²'''
+
+        start = 0 if with_filler else _FILLER_CELL_COUNT
+        return float(self.counts[start:] @ self._cell_areas[start:])
+
+
+def _read_def_header(data, filename, units=1000, die=None):
+    '''The distance units & die declared in data, & the position right after its "COMPONENTS n ;" (or None)'''
+
+    for match in _DEF_HEADER_PATTERN.finditer(data):
+        if match.group(1):
+            units = int(match.group(1))
+        elif match.group(2):
+            xs, ys = zip(*((int(x), int(y)) for x, y in _DEF_POINT_PATTERN.findall(match.group(2))))
+            die = min(xs), min(ys), max(xs), max(ys)
+        else:
+            if die is None or die[0] == die[2] or die[1] == die[3]:
+                raise ValueError(f'{filename}: no DIEAREA before its COMPONENTS')
+            return units, die, match.end()
+    return units, die, None
+
+
+def _def_blocks(stream):
+    '''Read a DEF stream in blocks of whole statements (each block but the last ends with ";")'''
+
+    tail = b''
+    while chunk := stream.read(_SCAN_WINDOW):
+        data = tail + chunk
+        end = data.rfind(b';') + 1
+        if end:
+            yield data[:end]
+        tail = data[end:]
+    if tail:
+        yield tail
+
+
+def _place_stream(stream, filename, grid):
+    '''Units & _PlacementGrid of the COMPONENTS of a DEF stream (read a block at a time)'''
+
+    units, die, placement = 1000, None, None
+    for block in _def_blocks(stream):
+        position = 0
+        if placement is None:
+            units, die, position = _read_def_header(block, filename, units, die)
+            if position is None:
+                continue
+            placement = _PlacementGrid(die, *grid)
+
+        end = _DEF_COMPONENTS_END_PATTERN.search(block, position)
+        components = _DEF_COMPONENT_PATTERN.findall(block, position, len(block) if end is None else end.start())
+        if components:
+            placement.add(components)
+        if end is not None:
+            break
+    return units, placement or _PlacementGrid(die or (0, 0, 1, 1), *grid)
+
+
+def _place_range(filename, start, end, die, grid):
+    '''_PlacementGrid of the components in bytes [start, end) of a DEF file (between two statements)'''
+
+    placement = _PlacementGrid(die, *grid)
+    with open(filename, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmfile:
+            _advise_sequential(mmfile, start, end)
+            while start < end:
+                window_end = end
+                if end - start > _SCAN_WINDOW:
+                    window_end = mmfile.find(b';', start + _SCAN_WINDOW, end) + 1 or end
+                components = _DEF_COMPONENT_PATTERN.findall(mmfile, start, window_end)
+                if components:
+                    placement.add(components)
+                start = window_end
+    return placement
 
-            for cell in _CELL_PATTERN.findall(mmfile):
-                is_filler = cell in _FILLER_CELLS
-                sites, transistors = _FILLER_CELLS[cell] if is_filler else _REGULAR_CELLS[cell]
-                if verbose:
-                    print(f'{filename}:  {cell}  => ({"Filler" if is_filler else "Regular"}, {sites}, {transistors})')
 
-                file_statistics['cells_with_filler'] += 1
-                file_statistics['sites_with_filler'] += sites
-                file_statistics['transistors_with_filler'] += transistors
-                if not is_filler:
-                    file_statistics['cells'] += 1
-                    file_statistics['sites'] += sites
-                    file_statistics['transistors'] += transistors
+def _place_file(filename, grid, jobs=1):
+    '''Units & _PlacementGrid of the COMPONENTS of a DEF file (split into one range per job)'''
 
+    with open(filename, 'rb') as file:
+        if not _is_mappable(file):
+            _advise_sequential(file)
+            with _open_decompressed(file) or file as stream:
+                return _place_stream(stream, filename, grid)
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mmfile:
+            units, die, start = _read_def_header(mmfile, filename)
+            if start is None:
+                return units, _PlacementGrid(die or (0, 0, 1, 1), *grid)
+            end = _DEF_COMPONENTS_END_PATTERN.search(mmfile, start)
+            end = len(mmfile) if end is None else end.start()
+            bounds = [start]
+            for job in range(1, jobs):
+                boundary = mmfile.find(b';', start + (end - start) * job // jobs, end) + 1
+                if boundary > bounds[-1]:
+                    bounds.append(boundary)
+            bounds.append(end)
+
+    if len(bounds) == 2:
+        return units, _place_range(filename, start, end, die, grid)
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_use_cell_table, initargs=_cell_table()) as executor:
+        placements = executor.map(_place_range, repeat(filename), bounds[:-1], bounds[1:], repeat(die), repeat(grid))
+        placement = next(placements)
+        for other in placements:
+            placement.merge(other)
+    return units, placement
+
+
+def get_sky130_placement_statistics(filename, grid=(32, 32), per_cell=False, jobs=1):
+    '''Count the cells placed in a DEF file (streaming its COMPONENTS) & the sites they use in each tile of a
+    columns x rows grid over the die
+
+    Returns file statistics (like get_sky130_cell_statistics_from_file()) with file_statistics['placement']
+    holding the die's (x0, y0, x1, y1) in µm, (rows, columns) NumPy arrays of the 'sites' & 'filler_sites' placed
+    in each tile (by placement point, bottom row first), & the 'utilization' (& 'utilization_with_filler') of the
+    die & 'peak_tile_utilization', each as a fraction of the area (1.0 is full, & cells placed past the edge of a
+    tile can take one over 1.0; areas are each cell's own, its LEF size for a loaded library)
+    Unplaced components are counted but not gridded, unknown sky130_* cells are counted apart, & with jobs, the
+    COMPONENTS of an uncompressed file are split into one range per job
+    '''
+
+    _import_numpy()
+    columns, rows = grid
+    if filename == '-':
+        file = sys.stdin.buffer
+        units, placement = _place_stream(_open_decompressed(file) or file, filename, grid)
+    else:
+        units, placement = _place_file(filename, grid, jobs or os.cpu_count() or 1)
+
+    file_statistics = _file_statistics_from_counts(filename, array('q', placement.counts.tolist()), per_cell)
+    x0, y0, x1, y1 = placement.die
+    die_area = (x1 - x0) * (y1 - y0) / units ** 2
+    file_statistics['placement'] = {
+        'die_area': tuple(coordinate / units for coordinate in placement.die),
+        'sites': placement.sites.reshape(rows, columns),
+        'filler_sites': placement.filler_sites.reshape(rows, columns),
+        'utilization': placement.cell_area() / die_area,
+        'utilization_with_filler': placement.cell_area(with_filler=True) / die_area,
+        'peak_tile_utilization': float(placement.area.max()) / (die_area / (rows * columns)),
+    }
     return file_statistics
 
 
+def _save_placement_grid(file_statistics, directory):
+    '''Write the placement grids of a DEF file to directory/<file name>.npz (sites, filler_sites, & die_area)'''
+
+    numpy = _import_numpy()
+    placement = file_statistics['placement']
+    name = 'stdin' if file_statistics['filename'] == '-' else os.path.basename(file_statistics['filename'])
+    numpy.savez_compressed(
+        os.path.join(directory, f'{name}.npz'), sites=placement['sites'], filler_sites=placement['filler_sites'],
+        die_area=numpy.array(placement['die_area']),
+    )
+
+
+def _parse_size(text):
+    '''Parse a byte count with an optional K/M/G suffix (for example, "256M")'''
+
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().removesuffix('B')
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def _parse_grid(text):
+    '''Parse a grid size as "COLUMNSxROWS" (or one number for a square grid) into (columns, rows)'''
+
+    columns, _, rows = text.lower().partition('x')
+    grid = int(columns), int(rows or columns)
+    if min(grid) < 1:
+        raise ValueError(f'Grid size {text!r} must be at least 1x1')
+    return grid
+
+
+# Columns of the CSV output (after the filename, & the module of each row with hierarchy)
+_CSV_COLUMNS = CellStatistics._fields[1:7]
+
+
+def _csv_header(per_cell=False, hierarchy=False, compare=False, placement=False):
+    if placement:
+        return ('file,cells,sites,transistors,cells_with_fill,sites_with_fill,transistors_with_fill,'
+                'utilization,utilization_with_fill,peak_tile_utilization')
+    if compare:
+        return 'file,cell,filler,baseline_count,count,delta_cells,delta_sites,delta_transistors,delta_area_um2'
+    if per_cell:
+        return 'file,cell,filler,count,sites,transistors'
+    if hierarchy:
+        return 'file,module,top,cells,sites,transistors,cells_with_fill,sites_with_fill,transistors_with_fill'
+    return 'file,cells,sites,transistors,cells_with_fill,sites_with_fill,transistors_with_fill'
+
+
+def _csv_rows(file_statistics, per_cell=False, hierarchy=False):
+    '''The CSV row(s) of a file'''
+
+    if hierarchy and not per_cell:
+        return [
+            ','.join(
+                str(int(module_statistics[key]) if key == 'top' else module_statistics[key])
+                for key in ('filename', 'module', 'top', *_CSV_COLUMNS)
+            )
+            for module_statistics in file_statistics['modules'].values()
+        ]
+    if per_cell:
+        return [
+            f'{file_statistics["filename"]},{cell},{int(_CELL_IDS[cell.encode()] < _FILLER_CELL_COUNT)},'
+            f'{count},{sites},{transistors}'
+            for cell, (count, sites, transistors) in file_statistics['per_cell'].items()
+        ]
+    return [','.join(str(file_statistics[key]) for key in ('filename', *_CSV_COLUMNS))]
+
+
+def _delta_csv_rows(deltas, baseline_statistics, file_statistics):
+    '''The CSV rows of how a file differs from the baseline (each changed cell type, then the totals)'''
+
+    rows = [
+        f'{deltas["filename"]},{cell},{int(_CELL_IDS[cell.encode()] < _FILLER_CELL_COUNT)},'
+        f'{",".join(map(str, cell_deltas))}'
+        for cell, cell_deltas in deltas['per_cell'].items()
+    ]
+    for total, suffix in (('total', ''), ('total_with_fill', '_with_filler')):
+        rows.append(','.join(map(str, (
+            deltas['filename'], total, '', baseline_statistics[f'cells{suffix}'], file_statistics[f'cells{suffix}'],
+            deltas[f'cells{suffix}'], deltas[f'sites{suffix}'], deltas[f'transistors{suffix}'],
+            deltas[f'area_um2{suffix}'],
+        ))))
+    return rows
+
+
+def _print_rows(file_statistics, per_cell=False, hierarchy=False, rows=None):
+    '''Print the CSV row(s) of a file (or the given rows)'''
+
+    if file_statistics['unknown_cells']:
+        print(f'{file_statistics["filename"]}: {file_statistics["unknown_cells"]} unknown sky130_* cells '
+              f'(not counted)', file=sys.stderr)
+    for row in _csv_rows(file_statistics, per_cell, hierarchy) if rows is None else rows:
+        print(row)
+    sys.stdout.flush()
+
+
+# Options of a scan request (passed on to get_sky130_cell_statistics_from_files)
+_SERVICE_OPTIONS = ('keep_order', 'split_size', 'per_cell', 'hierarchy', 'engine', 'incremental')
+
+
+def _parse_service_address(address):
+    '''A Unix socket path (anything with a "/", like "./cellstats.sock") or a TCP (host, port) like "localhost:8130"'''
+
+    if '/' in address or ':' not in address:
+        return address
+    host, _, port = address.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def _renamed(file_statistics, filename):
+    file_statistics['filename'] = filename
+    for module_statistics in file_statistics.get('modules', {}).values():
+        module_statistics['filename'] = filename
+    return file_statistics
+
+
+def _service_handler():
+    '''The request handler class of serve() (http.server is only imported by a service)'''
+
+    from http.server import BaseHTTPRequestHandler
+
+    class _ServiceHandler(BaseHTTPRequestHandler):
+        '''Answer POST /scan requests (a JSON object) with one JSON line of statistics per file, as each one finishes
+
+        A request names its "filenames" (relative to its "cwd"), "csv" asks for the CSV rows of each file too, & its
+        other keys are _SERVICE_OPTIONS
+        '''
+
+        def address_string(self):
+            # Unix socket clients have no address
+            return self.client_address[0] if self.client_address else 'local'
+
+        def do_POST(self):
+            if self.path != '/scan':
+                self.send_error(404)
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                cwd = request.get('cwd', os.getcwd())
+                paths = [os.path.join(cwd, name) for name in request['filenames']]
+                names = dict(zip(paths, request['filenames']))
+                options = {option: request[option] for option in _SERVICE_OPTIONS if option in request}
+                scan = get_sky130_cell_statistics_from_files(paths, **self.server.scan_options, **options)
+                # Errors in the request (or its first file) get an error status
+                results = chain([next(scan)], scan)
+            except StopIteration:
+                results = ()
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                self.send_error(400, f'{type(error).__name__}: {error}')
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.end_headers()
+            cache = self.server.scan_options['cache']
+            try:
+                for file_statistics in results:
+                    _renamed(file_statistics, names[file_statistics['filename']])
+                    if request.get('csv'):
+                        file_statistics['csv'] = _csv_rows(
+                            file_statistics, options.get('per_cell', False), options.get('hierarchy', False)
+                        )
+                    self.wfile.write(json.dumps(file_statistics).encode() + b'\n')
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client left (its pending scans are cancelled)
+            except (OSError, ValueError, KeyError) as error:
+                self.wfile.write(json.dumps({'error': f'{type(error).__name__}: {error}'}).encode() + b'\n')
+            finally:
+                scan.close()
+                if cache:
+                    cache.commit()
+
+    return _ServiceHandler
+
+
+def _remove_stale_socket(path):
+    '''Remove the Unix socket at path if no service listens on it anymore'''
+
+    if not os.path.exists(path) or not stat.S_ISSOCK(os.stat(path).st_mode):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+
+
+def serve(address, jobs=None, cache=None, readahead=0):
+    '''Answer scan requests at address (a Unix socket path or "host:port") until interrupted
+
+    The cell tables, compiled engines, worker pool, & optional ResultCache of this process stay warm for every
+    request, & concurrent requests share the pool
+    '''
+
+    import socketserver
+    from concurrent.futures import ProcessPoolExecutor
+    from http.server import ThreadingHTTPServer
+    address = _parse_service_address(address)
+    jobs = jobs or os.cpu_count() or 1
+    executor = None
+    if jobs > 1:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_use_cell_table, initargs=_cell_table())
+        # Start the workers now (instead of on the first request)
+        executor.submit(int).result()
+    if isinstance(address, str):
+        _remove_stale_socket(address)
+        server = socketserver.ThreadingUnixStreamServer(address, _service_handler())
+    else:
+        server = ThreadingHTTPServer(address, _service_handler())
+    server.daemon_threads = True
+    server.scan_options = {'jobs': jobs, 'cache': cache, 'readahead': readahead, 'executor': executor}
+    try:
+        with server:
+            server.serve_forever()
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+
+
+def _request_scan(address, filenames, csv=False, **options):
+    '''Yield the statistics of filenames from the service at address (as it sends them)
+
+    The request is plain HTTP/1.0 over a socket (the service answers with a status line, headers, & one JSON line
+    per file, then closes the connection), as importing http.client alone takes longer than a small scan
+    '''
+
+    address = _parse_service_address(address)
+    if isinstance(address, str):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(address)
+    else:
+        connection = socket.create_connection(address)
+    with connection, connection.makefile('rb') as response:
+        request = json.dumps({'filenames': list(filenames), 'cwd': os.getcwd(), 'csv': csv, **options}).encode()
+        connection.sendall(b'POST /scan HTTP/1.0\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                           b'Content-Length: %d\r\n\r\n%s' % (len(request), request))
+        status = response.readline().decode('latin-1').split(None, 2)
+        if len(status) < 2 or status[1] != '200':
+            raise RuntimeError(f'Scan request failed: {" ".join(status[1:]).strip() or "no response"}')
+        while response.readline().strip():
+            pass  # Headers
+        for line in response:
+            file_statistics = json.loads(line)
+            if 'error' in file_statistics:
+                raise RuntimeError(f'Scan request failed: {file_statistics["error"]}')
+            yield file_statistics
+
+
+def get_sky130_cell_statistics_from_service(address, filenames, keep_order=False, split_size=None, per_cell=False,
+                                            hierarchy=False, engine='structural', incremental=False):
+    '''Like get_sky130_cell_statistics_from_files(), but scanned by the service at address (see serve())'''
+
+    return _request_scan(address, filenames, keep_order=keep_order, split_size=split_size, per_cell=per_cell,
+                         hierarchy=hierarchy, engine=engine, incremental=incremental)
+
+
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='Report Skywater 130nm usage statistics')
-    parser.add_argument('filenames', nargs='+', help='1+ file(s) to parse (for example, "gate-level.v")')
+    parser.add_argument('filenames', nargs='*',
+                        help='1+ file(s) to parse (for example, "gate-level.v", "gate-level.v.gz" or "-" for stdin), '
+                             'directories to search, or quoted glob patterns (for example, "runs/*/results/**/*.v")')
+    parser.add_argument('--files-from', metavar='FILE',
+                        help='Also parse the files (or directories, or patterns) listed in FILE, one per line '
+                             '("-" for stdin)')
+    parser.add_argument('--ext',
+                        help='Comma-separated extensions of the netlists found in directories, each also matched '
+                             f'when compressed (default: {",".join(_NETLIST_EXTENSIONS)}, or .def with --def)')
+    parser.add_argument('--readahead', type=int, default=4, metavar='N',
+                        help='Prefetch the next N files while scanning (default: 4, 0 to disable)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Use verbose output')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of files to scan in parallel (default: all cores)')
+    parser.add_argument('--keep-order', action='store_true',
+                        help='Print rows in input order (instead of as each file finishes)')
+    parser.add_argument('--split-size', type=_parse_size, default='256M',
+                        help='Scan files larger than this as parallel byte ranges (default: 256M, 0 to disable)')
+    parser.add_argument('--per-cell', action='store_true',
+                        help='Print one row per cell type in each file (instead of the file totals)')
+    parser.add_argument('--no-cache', action='store_true', help='Neither read nor write the result cache')
+    parser.add_argument('--refresh', action='store_true', help='Rescan every file (then update the result cache)')
+    parser.add_argument('--cache-dir', default=_default_cache_dir(),
+                        help='Directory of the result cache (default: %(default)s)')
+    parser.add_argument('--cache-size', type=_parse_size, default='256M',
+                        help='Evict least recently used results beyond this size (default: 256M)')
+    parser.add_argument('--cache-hash', action='store_true',
+                        help='Identify cached files by a hash of their contents (instead of path, size, & mtime)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Cache the counts of content-defined chunks (about 1M each) of each file too, so a file '
+                             'edited since its last scan only has its changed chunks rescanned')
+    parser.add_argument('--engine', choices=_ENGINES, default='structural',
+                        help='Scanner: instantiations only ("structural"), every sky130_* token ("regex"), or every '
+                             'token matched against the cell vocabulary, counting unknown ones apart ("vocabulary")')
+    parser.add_argument('--fast-approx', action='store_true',
+                        help='Count every sky130_* token (faster, but comments, attributes, & net names count too; '
+                             'same as --engine regex)')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='Print how each file differs from BASELINE (scanned once): one row per cell type whose '
+                             'count changed, then the total cells, sites, transistors, & area in µm²')
+    parser.add_argument('--matrix', metavar='FILE',
+                        help='Also write a files x cell types matrix of counts to FILE: .npy (with .rows.txt & '
+                             '.columns.txt labels), .npz, .csv (one wide row per file), or .json')
+    parser.add_argument('--def', dest='placement', action='store_true',
+                        help='Read the files as placed DEF (streaming their COMPONENTS) & also print the utilization '
+                             'of each die & of its fullest tile, as fractions of their area (needs NumPy)')
+    parser.add_argument('--grid', type=_parse_grid, default='32x32',
+                        help='Tiles of the DEF placement grid, as COLUMNSxROWS (default: 32x32)')
+    parser.add_argument('--grid-output', metavar='DIR',
+                        help='Write the placement grid of each DEF file to DIR/<file name>.npz')
+    parser.add_argument('-k', '--keep-going', action='store_true',
+                        help='Record the files that cannot be scanned in an "error" column (& the unknown cells of the '
+                             'others in an "unknown_cells" column) instead of stopping, then exit with status 1')
+    parser.add_argument('--journal', metavar='FILE',
+                        help='Journal each finished file to FILE, & on a rerun, reprint the rows of the files it holds '
+                             'instead of scanning them again (so an interrupted batch resumes where it stopped)')
+    parser.add_argument('--hierarchy', action='store_true',
+                        help='Print one row per module, counting each module once per instance (including submodules)')
+    parser.add_argument('--library', default='builtin',
+                        help='Comma-separated cell libraries: "builtin", names under $PDK_ROOT (hd, hdll, hs, ms, ls, '
+                             'lp, hvl), library directories, or LEF files (default: builtin)')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Write a record of each cell matched to FILE (scanning files one at a time)')
+    parser.add_argument('--trace-format', choices=('jsonl', 'csv'),
+                        help='Format of the trace (default: csv for a ".csv" FILE, else jsonl)')
+    parser.add_argument('--trace-sample', type=int, default=1, metavar='N', help='Trace every Nth match only')
+    parser.add_argument('--trace-aggregate', action='store_true',
+                        help='Trace one record per cell type & file (with its first offset & line) instead')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print the bytes, matches, & time of each file (& of the run) to stderr')
+    parser.add_argument('--stats-json', metavar='FILE', help='Write the same statistics to a JSON file')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Dump a cProfile of this process to FILE (use -j 1 to include the scanning)')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help='Run as a service answering scan requests at ADDRESS: a Unix socket path (with a "/") or '
+                             '"host:port" for HTTP (keeps the tables, worker pool, & result cache warm)')
+    parser.add_argument('--connect', metavar='ADDRESS', default=os.environ.get('CELLSTATS_SERVICE'),
+                        help='Have the service at ADDRESS scan the files (with its own libraries & cache; '
+                             'default: $CELLSTATS_SERVICE)')
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.compare and (args.per_cell or args.hierarchy or args.connect):
+        parser.error('--compare cannot be used with --per-cell, --hierarchy, or --connect')
+    if args.placement and (args.per_cell or args.hierarchy or args.compare or args.matrix or args.connect):
+        parser.error('--def cannot be used with --per-cell, --hierarchy, --compare, --matrix, or --connect')
+    if args.matrix and args.connect:
+        parser.error('--matrix cannot be used with --connect')
+    if (args.keep_going or args.journal) and (args.placement or args.connect):
+        parser.error('--keep-going & --journal cannot be used with --def or --connect')
+    if args.incremental and args.no_cache and not args.connect:
+        parser.error('--incremental needs the result cache (drop --no-cache)')
+    if args.connect and not args.serve:
+        for option, value in (('-v', args.verbose), ('--trace', args.trace), ('--stats', args.stats),
+                              ('--stats-json', args.stats_json), ('--profile', args.profile),
+                              ('--library', args.library != 'builtin')):
+            if value:
+                parser.error(f'{option} cannot be used with --connect (the service scans the files)')
+    if args.library != 'builtin':
+        try:
+            use_cell_libraries(args.library.split(','), None if args.no_cache else args.cache_dir)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+
+    if args.serve:
+        import signal
+        # Clean up (as on Ctrl-C) when stopped
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit())
+        cache = None
+        if not args.no_cache:
+            cache = ResultCache(args.cache_dir, args.cache_size, args.cache_hash, args.refresh)
+        print(f'Serving scan requests at {args.serve}', file=sys.stderr, flush=True)
+        try:
+            serve(args.serve, args.jobs, cache, args.readahead)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if cache:
+                cache.close()
+        sys.exit()
+
+    if not args.filenames and not args.files_from:
+        parser.error('no files to parse (give filenames, directories, patterns, or --files-from)')
+    paths = args.filenames
+    if args.files_from:
+        if args.files_from == '-':
+            paths = [*paths, *filter(None, map(str.strip, sys.stdin))]
+        else:
+            with open(args.files_from) as file:
+                paths = [*paths, *filter(None, map(str.strip, file))]
+    extensions = _NETLIST_EXTENSIONS if not args.placement else ('.def',)
+    if args.ext:
+        extensions = tuple(extension if extension.startswith('.') else f'.{extension}'
+                           for extension in args.ext.split(',') if extension)
+    filenames = expand_netlist_paths(paths, extensions, args.keep_going)
+
+    if args.connect:
+        if '-' in paths:
+            parser.error('stdin ("-") cannot be scanned by a service')
+        print(_csv_header(args.per_cell, args.hierarchy), flush=True)
+        try:
+            for file_statistics in _request_scan(
+                args.connect, filenames, csv=True, keep_order=args.keep_order, split_size=args.split_size,
+                per_cell=args.per_cell, hierarchy=args.hierarchy, engine='regex' if args.fast_approx else args.engine,
+                incremental=args.incremental,
+            ):
+                _print_rows(file_statistics, rows=file_statistics['csv'])
+        except (OSError, RuntimeError) as error:
+            sys.exit(f'cellstats: {error}')
+        sys.exit()
+
+    verbose = args.verbose
+    trace_file = None
+    if args.trace:
+        trace_format = args.trace_format or ('csv' if args.trace.lower().endswith('.csv') else 'jsonl')
+        trace_file = open(args.trace, 'w', buffering=1024 * 1024)
+        verbose = CellTracer(trace_file, trace_format, args.trace_sample, args.trace_aggregate)
+
+    if args.placement:
+        print(_csv_header(placement=True), flush=True)
+        if args.grid_output:
+            os.makedirs(args.grid_output, exist_ok=True)
+        try:
+            for filename in filenames:
+                file_statistics = get_sky130_placement_statistics(filename, args.grid, jobs=args.jobs)
+                placement = file_statistics['placement']
+                _print_rows(file_statistics, rows=[
+                    f'{_csv_rows(file_statistics)[0]},{placement["utilization"]:.4f},'
+                    f'{placement["utilization_with_filler"]:.4f},{placement["peak_tile_utilization"]:.4f}'
+                ])
+                if args.grid_output:
+                    _save_placement_grid(file_statistics, args.grid_output)
+        except (ModuleNotFoundError, ValueError) as error:
+            sys.exit(f'cellstats: {error}')
+        sys.exit()
+
+    # Verbose output & traces list every match, so they always need a real scan
+    cache = None
+    if not args.no_cache and not verbose:
+        cache = ResultCache(args.cache_dir, args.cache_size, args.cache_hash, args.refresh)
+
+    engine = 'regex' if args.fast_approx else args.engine
+    per_cell = args.per_cell or bool(args.compare) or bool(args.matrix)
+    jobs = args.jobs if args.split_size or len(paths) != 1 or not os.path.isfile(paths[0]) else 1
+    stats = ScanStats() if args.stats or args.stats_json else None
+    # Outputs that may be refused are opened before anything is printed
+    journal = None
+    if args.journal:
+        try:
+            journal = BatchJournal(args.journal, {
+                'per_cell': per_cell, 'hierarchy': args.hierarchy, 'engine': engine, 'library': args.library,
+                'compare': args.compare,
+            })
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    matrix = None
+    if args.matrix:
+        try:
+            matrix = CellMatrixWriter(args.matrix)
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    header = _csv_header(args.per_cell, args.hierarchy, args.compare)
+    if args.keep_going:
+        header += ',unknown_cells,error'
+    print(header, flush=True)
+    failed = 0
+    profile = None
+    if args.profile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        baseline_statistics = None
+        if args.compare:
+            try:
+                baseline_statistics = next(get_sky130_cell_statistics_from_files(
+                    [args.compare], verbose, args.jobs, split_size=args.split_size, per_cell=True, cache=cache,
+                    engine=engine, stats=stats, incremental=args.incremental,
+                ))
+            except _file_errors() as error:
+                # Nothing can be compared without the baseline (so even with --keep-going, stop here)
+                sys.exit(f'cellstats: baseline {args.compare}: {error}')
+        journaled, finished = (), set()
+        if journal:
+            # Files finished before the batch was interrupted are reprinted first
+            journaled, finished = [*journal.finished.values()], set(journal.finished)
+            filenames = (filename for filename in filenames if filename not in finished)
+        for file_statistics in chain(journaled, get_sky130_cell_statistics_from_files(
+            filenames, verbose, jobs, args.keep_order, args.split_size, per_cell, cache, args.hierarchy, engine,
+            stats, args.readahead, incremental=args.incremental, keep_going=args.keep_going,
+        )):
+            if 'error' in file_statistics:
+                failed += 1
+                print(f'cellstats: {file_statistics["filename"]}: {file_statistics["error"]}', file=sys.stderr)
+                print(','.join([file_statistics['filename'], *[''] * (header.count(',') - 1),
+                                _csv_quote(file_statistics['error'])]), flush=True)
+                continue
 
-    print('file,cells,sites,transistors,cells_with_fill,sites_with_fill,transistors_with_fill')
-    for filename in args.filenames:
-        file_statistics = get_sky130_cell_statistics_from_file(filename, args.verbose)
+            output_start = time.perf_counter()
+            if matrix:
+                matrix.add(file_statistics)
+            rows = None
+            if baseline_statistics is not None:
+                deltas = get_sky130_cell_deltas(baseline_statistics, file_statistics)
+                rows = _delta_csv_rows(deltas, baseline_statistics, file_statistics)
+            if args.keep_going:
+                rows = [f'{row},{file_statistics["unknown_cells"]},'
+                        for row in rows or _csv_rows(file_statistics, args.per_cell, args.hierarchy)]
+            _print_rows(file_statistics, args.per_cell, args.hierarchy, rows)
+            if journal and file_statistics['filename'] not in finished:
+                journal.add(file_statistics)
+            if stats is not None and 'scan_stats' in file_statistics:
+                file_statistics['scan_stats']['output_s'] = time.perf_counter() - output_start
+    finally:
+        if cache:
+            cache.close()
+        if matrix:
+            matrix.close()
+        if journal:
+            journal.close()
+        if trace_file:
+            trace_file.close()
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(args.profile)
 
-        print(','.join(
-            str(statistic)
-            for statistic in file_statistics.values()
-        ))
+    if args.stats:
+        stats.write(sys.stderr)
+    if args.stats_json:
+        with open(args.stats_json, 'w') as file:
+            json.dump(stats.to_json(), file, indent=2)
+    if failed:
+        sys.exit(f'cellstats: {failed} of the files failed')
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+#
+# Tests of cellstats: a file scanned as split byte ranges, streamed in chunks, or rescanned incrementally after
+# edits must count exactly what a single serial scan does (run with "python -m unittest" or pytest)
+
+import io
+import os
+import random
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+import cellstats
+
+# Statements (& the cells that the structural engine counts in each) that put comments, attributes, strings, &
+# escaped identifiers across window & range boundaries, with ";" at the end of a line (a statement end) inside some
+_SNIPPETS = (
+    (b'  sky130_fd_sc_hd__inv_1 u%d (.A(a), .Y(y));\n', {b'sky130_fd_sc_hd__inv_1': 1}),
+    (b'  sky130_fd_sc_hd__decap_4 f%d ();\n', {b'sky130_fd_sc_hd__decap_4': 1}),
+    (b'  /* sky130_fd_sc_hd__buf_1 c%d (.A(a));\n     still commented;\n  */\n', {}),
+    (b'  (* src = "x.v:%d";\n     keep *) sky130_fd_sc_hd__nand2_1 n (.A(a), .B(b), .Y(y));\n',
+     {b'sky130_fd_sc_hd__nand2_1': 1}),
+    (b'  // sky130_fd_sc_hd__and2_1 l%d (.A(a));\n', {}),
+    (b'  assign s%d = "sky130_fd_sc_hd__or2_1 s (;\\\nsky130_fd_sc_hd__or2_1 t (";\n', {}),
+    (b'  sky130_fd_sc_hd__dfxtp_1 #(.INIT(1)) \\r%d/q (.D(d), .Q(\\q;x ));\n', {b'sky130_fd_sc_hd__dfxtp_1': 1}),
+    (b'  wire sky130_fd_sc_hd__inv_1_net%d;\n', {}),
+    (b'  /*' + b' x;\n' * 24 + b'  sky130_fd_sc_hd__inv_1 z%d (; */\n', {}),
+)
+
+
+def _netlist(seed, statements):
+    '''A random netlist of statements from _SNIPPETS & the cells that the structural engine counts in it'''
+
+    rnd = random.Random(seed)
+    lines, cells = [b'module m (a, y);\n'], Counter()
+    for index in range(statements):
+        snippet, snippet_cells = rnd.choice(_SNIPPETS)
+        lines.append(snippet % index if b'%d' in snippet else snippet)
+        cells.update(snippet_cells)
+    lines.append(b'endmodule\n')
+    return b''.join(lines), cells
+
+
+def _histogram(counts):
+    return Counter({
+        cellstats._CELL_NAMES[cell_id]: count for cell_id, count in enumerate(counts[:-1]) if count
+    })
+
+
+class SmallWindowTestCase(unittest.TestCase):
+    '''Shrinks the scan window & the minimum split size, so that small netlists span many windows & ranges'''
+
+    def setUp(self):
+        for name, value in (('_SCAN_WINDOW', 64), ('_MIN_SPLIT_SIZE', 1)):
+            patcher = mock.patch.object(cellstats, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, data, name='netlist.v'):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as file:
+            file.write(data)
+        return filename
+
+    def serial_counts(self, data, engine='structural'):
+        # In a single window (so the reference does not depend on the boundaries under test)
+        with mock.patch.object(cellstats, '_SCAN_WINDOW', len(data) + 1):
+            return cellstats._count_cells(data, 0, len(data), engine=engine)
+
+
+class SplitScanTest(SmallWindowTestCase):
+
+    def split_counts(self, filename, split_size, engine='structural'):
+        ranges = cellstats._split_file(filename, split_size, engine)
+        results = [cellstats._scan_file(filename, start, end, engine=engine) for start, end in ranges]
+        return cellstats._merge_range_counts(filename, ranges, results, engine), len(ranges)
+
+    def test_serial_scan_counts_instantiations_only(self):
+        for seed in range(50):
+            data, cells = _netlist(seed, 40)
+            self.assertEqual(_histogram(self.serial_counts(data)), cells, seed)
+            # & the same in small windows
+            self.assertEqual(_histogram(cellstats._count_cells(data, 0, len(data))), cells, seed)
+
+    def test_split_scan_matches_serial_scan(self):
+        for seed in range(100):
+            data, _ = _netlist(seed, 30)
+            filename = self.write(data)
+            for engine in cellstats._ENGINES:
+                expected = self.serial_counts(data, engine)
+                for split_size in (17, 64, 301):
+                    counts, ranges = self.split_counts(filename, split_size, engine)
+                    self.assertGreater(ranges, 1)
+                    self.assertEqual(counts, expected, (seed, engine, split_size))
+
+    def test_range_resumes_after_comment_across_boundary(self):
+        # Every statement end in the comment is a place to split, so the next range starts inside of it
+        data = (b'module m;\n  sky130_fd_sc_hd__inv_1 a (.A(x));\n  /*\n'
+                + b'  sky130_fd_sc_hd__inv_1 b (.A(x));\n' * 20
+                + b'  */\n  sky130_fd_sc_hd__buf_1 c (.A(x));\nendmodule\n')
+        counts, ranges = self.split_counts(self.write(data), 40)
+        self.assertGreater(ranges, 2)
+        self.assertEqual(_histogram(counts), {b'sky130_fd_sc_hd__inv_1': 1, b'sky130_fd_sc_hd__buf_1': 1})
+
+
+
+class StreamScanTest(SmallWindowTestCase):
+
+    def stream_counts(self, data, engine='structural', tracer=None):
+        return cellstats._count_cells_in_stream(io.BytesIO(data), tracer, engine)
+
+    def traced(self, count):
+        output = io.StringIO()
+        tracer = cellstats.CellTracer(output, 'jsonl')
+        tracer.begin('netlist.v')
+        count(tracer)
+        tracer.end()
+        return output.getvalue()
+
+    def test_stream_scan_matches_serial_scan(self):
+        for seed in range(60):
+            data, _ = _netlist(seed, 30)
+            if seed % 3 == 0:
+                data += b'/* left open\n  sky130_fd_sc_hd__inv_1 o (.A(a));\n'
+            for engine in cellstats._ENGINES:
+                expected = self.serial_counts(data, engine)
+                for window in (13, 64):
+                    with mock.patch.object(cellstats, '_SCAN_WINDOW', window):
+                        self.assertEqual(self.stream_counts(data, engine), expected, (seed, engine, window))
+
+    def test_stream_trace_matches_serial_trace(self):
+        for seed in range(30):
+            data, _ = _netlist(seed, 20)
+            for engine in cellstats._ENGINES:
+                expected = self.traced(lambda tracer: cellstats._count_cells(data, 0, len(data), tracer, engine))
+                streamed = self.traced(lambda tracer: self.stream_counts(data, engine, tracer))
+                self.assertEqual(streamed, expected, (seed, engine))
+
+    def test_stream_skips_long_comment_once(self):
+        data = (b'module m;\n  sky130_fd_sc_hd__inv_1 a (.A(x));\n  /*'
+                + b' sky130_fd_sc_hd__inv_1 b (.A(x));\n' * 3000
+                + b'  */\n  sky130_fd_sc_hd__buf_1 c (.A(x));\nendmodule\n')
+        engine = cellstats._ENGINES['structural']
+        scanned = []
+        count = engine.count
+        with mock.patch.object(engine, 'count', lambda buffer, start, end, tracer=None: (
+            scanned.append(end - start) or count(buffer, start, end, tracer)
+        )):
+            counts = self.stream_counts(data)
+        self.assertEqual(_histogram(counts), {b'sky130_fd_sc_hd__inv_1': 1, b'sky130_fd_sc_hd__buf_1': 1})
+        # Each chunk is scanned about once (the comment is not rescanned as each chunk of it is read)
+        self.assertLess(sum(scanned), 2 * len(data))
+
+    def test_ends_cleanly(self):
+        engine = cellstats._ENGINES['structural']
+        data = (b'sky130_fd_sc_hd__inv_1 a (.A(x));\n/* sky130_fd_sc_hd__inv_1 b (.A(x));\n'
+                b' */ sky130_fd_sc_hd__buf_1 c (.A(x));\n')
+        first_end = data.index(b';\n') + 2
+        self.assertTrue(engine._ends_cleanly(data, 0, first_end))
+        # Inside the comment, or not at a statement end
+        self.assertFalse(engine._ends_cleanly(data, 0, data.index(b';\n', first_end) + 2))
+        self.assertFalse(engine._ends_cleanly(data, 0, 5))
+        self.assertTrue(engine._ends_cleanly(data, 0, len(data)))
+
+    def test_count_exactly_runs_past_end(self):
+        engine = cellstats._ENGINES['structural']
+        data = (b'sky130_fd_sc_hd__inv_1 a (.A(x));\n/* sky130_fd_sc_hd__inv_1 b (.A(x));\n'
+                b' */ sky130_fd_sc_hd__buf_1 c (.A(x));\n')
+        end = data.index(b';\n', data.index(b';\n') + 2) + 2
+        histogram, resume = engine._count_exactly(data, 0, end)
+        self.assertEqual(engine._cell_histogram(histogram), {b'sky130_fd_sc_hd__inv_1': 1})
+        self.assertEqual(resume, data.index(b'*/') + 2)
+        # The next window resumes after the comment, so together they count every cell once
+        histogram, _ = engine.count(data, resume, len(data))
+        self.assertEqual(histogram, {b'sky130_fd_sc_hd__buf_1': 1})
+
+
+
+class IncrementalScanTest(SmallWindowTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name, value in (('_CHUNK_SIZE', 64), ('_MAX_CHUNK_SIZE', 256), ('_CHUNK_MASK', 3)):
+            patcher = mock.patch.object(cellstats, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cache = cellstats.ResultCache(os.path.join(self.directory, 'cache'), hash_contents=True)
+        self.addCleanup(self.cache.close)
+
+    def incremental_counts(self, filename, engine='structural'):
+        file_statistics, = cellstats.iter_sky130_cell_statistics(
+            [filename], jobs=1, per_cell=True, cache=self.cache, engine=engine, incremental=True
+        )
+        return file_statistics
+
+    def full_counts(self, filename, engine='structural'):
+        file_statistics, = cellstats.iter_sky130_cell_statistics([filename], jobs=1, per_cell=True, engine=engine)
+        return file_statistics
+
+    def assert_incremental_scan_matches_full_scan(self, data, engine='structural'):
+        filename = self.write(data)
+        self.assertGreater(len(cellstats._plan_chunks(filename, self.cache, engine)), 2)
+        self.assertEqual(self.incremental_counts(filename, engine), self.full_counts(filename, engine))
+
+    def test_incremental_scan_after_edits_matches_full_scan(self):
+        for seed in range(25):
+            rnd = random.Random(seed)
+            data, _ = _netlist(seed, 40)
+            for engine in cellstats._ENGINES:
+                edited = data
+                self.assert_incremental_scan_matches_full_scan(edited, engine)
+                for _ in range(3):
+                    # Insert, delete, or replace a line (so the chunks around it change & the others are reused)
+                    lines = edited.splitlines(keepends=True)
+                    index = rnd.randrange(1, len(lines) - 1)
+                    snippet, _ = rnd.choice(_SNIPPETS)
+                    snippet = snippet % index if b'%d' in snippet else snippet
+                    lines[index:index + rnd.randrange(2)] = [snippet] * rnd.randrange(2)
+                    edited = b''.join(lines)
+                    self.assert_incremental_scan_matches_full_scan(edited, engine)
+
+    def test_comment_across_chunks(self):
+        cells = b''.join(b'  sky130_fd_sc_hd__inv_1 u%d (.A(a), .Y(y));\n' % index for index in range(40))
+        data = b'module m (a, y);\n' + cells + b'endmodule\n'
+        self.assert_incremental_scan_matches_full_scan(data)
+        # A comment opened in one chunk & closed several chunks later (which keep their cached counts)
+        lines = data.splitlines(keepends=True)
+        lines[5] = b'  /* ' + lines[5]
+        lines[30] = lines[30].rstrip() + b' */\n'
+        commented = b''.join(lines)
+        chunks = cellstats._plan_chunks(self.write(commented), self.cache, 'structural')
+        self.assertTrue(any(cached_counts is not None for _, _, _, cached_counts in chunks))
+        self.assert_incremental_scan_matches_full_scan(commented)
+        self.assertEqual(self.incremental_counts(self.write(commented)).cells, 40 - 26)
+        # & reopened
+        self.assert_incremental_scan_matches_full_scan(data)
+        self.assertEqual(self.incremental_counts(self.write(data)).cells, 40)
+
+
+if __name__ == '__main__':
+    unittest.main()